@@ -0,0 +1,84 @@
+# asyncio counterpart to the direct command interface of `ev3.EV3`: sending a command returns an
+# awaitable resolving to the reply, so that all bricks, button polling and any other pipes can be
+# driven from a single event loop without blocking.
+
+import asyncio
+import struct
+
+from cmd import cmd_pressed, pressed
+import ev3
+
+
+# Wraps the existing USB connection of an `ev3.EV3`; its reply reader thread completes the futures
+# we are awaiting. USB writes are short enough to simply be done directly.
+class AsyncEV3:
+
+    def __init__(self, brick):
+        self.brick = brick
+
+    # Returns the reply or only the message counter if no reply is requested (no global memory and
+    # the brick not in SYNC mode); a reply is always awaited and never waited for on the loop
+    async def send_direct_cmd(self, ops, local_mem=0, global_mem=0):
+        if global_mem == 0 and self.brick.sync_mode != ev3.SYNC:
+            return self.brick.send_direct_cmd(ops, local_mem=local_mem)
+        future = self.brick.send_direct_cmd_future(ops, local_mem=local_mem, global_mem=global_mem)
+        return self.brick.check_reply(await asyncio.wrap_future(future))
+
+    def close(self):
+        pass # the connection belongs to the wrapped brick
+
+# Direct commands over a local stream socket, e.g. to the brick stand-in of `sim.serve()`, with
+# the replies being demultiplexed by a reader task; once that fails, every (also every later)
+# command raises its error
+class SocketEV3:
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.msg_cnt = 41
+        self.pending = {}
+        self.error = None
+        self.task = asyncio.get_running_loop().create_task(self.read_replies())
+
+    async def read_replies(self):
+        try:
+            while True:
+                size = await self.reader.readexactly(2)
+                reply = size + await self.reader.readexactly(struct.unpack('<H', size)[0])
+                future = self.pending.pop(reply[2:4], None)
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except (asyncio.IncompleteReadError, OSError) as e:
+            self.error = e
+            for future in self.pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            self.pending.clear()
+
+    async def send_direct_cmd(self, ops, local_mem=0, global_mem=0):
+        if self.error is not None:
+            raise self.error
+        self.msg_cnt = self.msg_cnt + 1 if self.msg_cnt < 65535 else 1
+        counter = struct.pack('<H', self.msg_cnt)
+        cmd_type = ev3._DIRECT_COMMAND_REPLY if global_mem > 0 else ev3._DIRECT_COMMAND_NO_REPLY
+        if global_mem > 0:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[counter] = future
+        self.writer.write(b''.join([
+            struct.pack('<h', len(ops) + 5), counter, cmd_type,
+            struct.pack('<h', local_mem * 1024 + global_mem),
+            ops
+        ]))
+        if global_mem == 0:
+            return counter
+        return ev3.check_direct_reply(await future)
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+async def open_socket(path):
+    return SocketEV3(*await asyncio.open_unix_connection(path))
+
+async def is_pressed(brick, port):
+    return pressed(await brick.send_direct_cmd(cmd_pressed(port, 0), global_mem=1))
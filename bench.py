@@ -0,0 +1,340 @@
+# Benchmarks for the host side of the robot; they all run against simulated hardware.
+# Usage: `python bench.py [NAME ...]` (runs all benchmarks if no names are given)
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+import aev3
+import control
+import ev3
+import sim
+import solcache
+import solve
+import tracing
+
+
+# Random solution in the robot's move encoding, consecutive moves are always on different axes
+def random_sol(n, p_axial=.3):
+    sol = []
+    axis = -1
+    for _ in range(n):
+        axis = random.choice([a for a in range(3) if a != axis])
+        faces = [2 * axis, 2 * axis + 1]
+        if random.random() < p_axial:
+            random.shuffle(faces)
+            sol.append(tuple(4 * f + random.randrange(4) for f in faces))
+        else:
+            sol.append(4 * random.choice(faces) + random.randrange(4))
+    return sol
+
+
+# Direct command round trips per second with 1, 2 and 3 bricks being driven concurrently
+def bench_demux(n_cmds=500):
+    for n_bricks in range(1, 4):
+        bricks = [sim.connect(sim.FakeDevice()) for _ in range(n_bricks)]
+
+        def roundtrips(brick):
+            for _ in range(n_cmds):
+                brick.send_direct_cmd(ev3.opNop, global_mem=1)
+
+        tick = time.time()
+        with ThreadPoolExecutor(n_bricks) as pool:
+            list(pool.map(roundtrips, bricks))
+        tock = time.time() - tick
+        print('%d brick(s): %7.1f round trips/s' % (n_bricks, n_bricks * n_cmds / tock))
+
+# Latency of awaited direct commands through the asyncio transports, all bricks driven concurrently
+# from one event loop
+def bench_aio(n_cmds=500):
+    async def roundtrips(brick):
+        for _ in range(n_cmds):
+            await aev3.is_pressed(brick, 0)
+
+    async def run(connect):
+        for n_bricks in range(1, 4):
+            bricks = [await connect() for _ in range(n_bricks)]
+            tick = time.time()
+            await asyncio.gather(*[roundtrips(brick) for brick in bricks])
+            tock = time.time() - tick
+            print('  %d brick(s): %.3fms/cmd, %7.1f cmds/s' % (
+                n_bricks, 1000 * tock / n_cmds, n_bricks * n_cmds / tock
+            ))
+            for brick in bricks:
+                brick.close()
+            await asyncio.sleep(.01) # let the stand-ins see the disconnect
+
+    async def main():
+        print('usb:')
+        await run(lambda: asyncio.sleep(0, aev3.AsyncEV3(sim.connect(sim.FakeDevice()))))
+        print('socket:')
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'ev3.sock')
+            server = await sim.serve(path)
+            await run(lambda: aev3.open_socket(path))
+            server.close()
+
+    asyncio.run(main())
+
+# Host overhead per move for getting the direct command bytes: compiling them from scratch every time
+# (as originally) vs. looking them up in the command table; then also including the actual send
+def bench_cmds(n_sols=1000, sol_len=20):
+    sols = [random_sol(sol_len) for _ in range(n_sols)]
+    robot = control.Robot([sim.connect(sim.FakeDevice(0)) for _ in range(3)])
+    n_moves = n_sols * sol_len
+
+    keys = []
+    for sol in sols:
+        for i in range(len(sol)):
+            next = sol[i + 1] if i < len(sol) - 1 else None
+            keys.append((sol[i], None if next is None else control.cut(sol[i], next)))
+
+    tick = time.time()
+    for m, cls in keys:
+        if control.is_axial(m):
+            control.compile_move1(m, cls)
+        else:
+            control.compile_move(m, cls)
+    print('compile:     %6.2fus/move' % (1e6 * (time.time() - tick) / n_moves))
+    for m, cls in keys:
+        control.move_cmd(m, cls) # warm up the table
+    tick = time.time()
+    for m, cls in keys:
+        control.move_cmd(m, cls)
+    print('lookup:      %6.2fus/move' % (1e6 * (time.time() - tick) / n_moves))
+
+    tick = time.time()
+    for sol in sols:
+        for i in range(len(sol)):
+            robot.command(sol, i)
+    print('command:     %6.2fus/move (incl. cut classes)' % (1e6 * (time.time() - tick) / n_moves))
+
+    for brick in robot.bricks:
+        brick.sync_mode = ev3.ASYNC
+    tick = time.time()
+    for sol in sols:
+        for i in range(len(sol)):
+            c = robot.command(sol, i)
+            robot.bricks[c.brick].send_direct_cmd(c.ops, global_mem=c.global_mem)
+    print('+ send:      %6.2fus/move' % (1e6 * (time.time() - tick) / n_moves))
+
+# Latency of selecting the best out of a growing number of candidate solutions, one by one vs. batched
+def bench_select(sol_len=20):
+    for n_sols in [5, 50, 500, 5000]:
+        sols = [random_sol(sol_len) for _ in range(n_sols)]
+
+        tick = time.time()
+        times = [control.expected_time(control.optim_halfdirs(sol)) for sol in sols]
+        control.optim_halfdirs(sols[times.index(min(times))])
+        tock1 = time.time() - tick
+
+        tocks = []
+        for objective in control.OBJECTIVES:
+            tick = time.time()
+            times = control.rate_batch(control.encode_batch(sols), objective)
+            control.optim_halfdirs(sols[times.argmin()], objective)
+            tocks.append(time.time() - tick)
+
+        print('%4d candidates: %8.2fms single, batched %s' % (n_sols, 1000 * tock1, ', '.join(
+            '%8.2fms %s' % (1000 * tock, objective) for tock, objective in zip(tocks, control.OBJECTIVES)
+        )))
+
+# Solve latencies with a solver process crashing every few commands (using the fake solver with a 1s
+# warmup): restarting a single solver cold vs. failing over to a warm standby in a pool
+def bench_failover(n_solves=8):
+    cmd = ['./fake_twophase.py', '-m', '25', '-w', '100', '--warmup-millis', '10', '--crash-after', '3']
+    facecube = 'UUUUUUUUURRRRRRRRRFFFFFFFFFDDDDDDDDDLLLLLLLLLBBBBBBBBB'
+
+    def run(solver, retry):
+        lat = []
+        for _ in range(n_solves):
+            tick = time.time()
+            solver = retry(solver)
+            lat.append(time.time() - tick)
+            time.sleep(.5) # robot executing, background refill may happen here
+        print('  ' + ' '.join('%.3f' % t for t in lat))
+        return solver
+
+    def cold(solver):
+        try:
+            solver.solve(facecube)
+        except solve.SolverError:
+            solver.disconnect()
+            solver = solve.Solver(cmd).connect()
+            solver.solve(facecube)
+        return solver
+
+    print('cold restart:')
+    run(solve.Solver(cmd).connect(), cold).disconnect()
+    def pooled(pool):
+        pool.solve(facecube) # fails over internally
+        return pool
+
+    print('pool:')
+    with solve.SolverPool(cmd=cmd) as pool:
+        run(pool, pooled)
+
+# A search running into its timeout (100ms search, 50ms timeout): the solver must not be usable
+# afterwards, its late output would otherwise be taken as the reply to the next command
+def bench_timeout():
+    facecube = 'UUUUUUUUURRRRRRRRRFFFFFFFFFDDDDDDDDDLLLLLLLLLBBBBBBBBB'
+    solver = solve.Solver(['./fake_twophase.py', '-m', '100'], timeout=.05).connect()
+    for cube in [facecube, 'ping']:
+        tick = time.time()
+        try:
+            res = 'returned %d solutions' % len(solver.solve(cube))
+        except solve.SolverError as e:
+            res = str(e)
+        print('%-5s %.3fs, %s' % (cube[:4], time.time() - tick, res))
+        time.sleep(.2) # late output arrives
+    print('alive: %s' % solver.alive())
+
+# Solution cache lookups: misses, hits of the exact same cube and hits of symmetric cubes
+def bench_cache(n_cubes=200):
+    cmd = ['./fake_twophase.py', '-m', '25', '-n', '5']
+    with tempfile.TemporaryDirectory() as tmp, solve.Solver(cmd) as solver, \
+            solcache.SolutionCache(os.path.join(tmp, 'solves.cache')) as cache:
+        cached = solcache.CachedSolver(solver, cache)
+        cubes = [''.join(random.choice(solcache.FACES) for _ in range(54)) for _ in range(n_cubes)]
+        syms = [random.choice(solcache.SYMS).cube(cube) for cube in cubes]
+        for name, cubes in [('miss', cubes), ('hit', cubes), ('symmetric hit', syms)]:
+            tick = time.time()
+            for cube in cubes:
+                cached.solve(cube)
+            print('%-14s %8.1fus' % (name + ':', 1e6 * (time.time() - tick) / n_cubes))
+
+# Latency of a scramble request with the scramble generated on demand vs. taken from the prefetcher
+# (which refills while the robot is executing the previous one)
+def bench_prefetch(n_scrambles=8):
+    cmd = ['./fake_twophase.py', '-m', '25', '-n', '5']
+
+    def select(sols):
+        sols = [solve.translate(sol) for sol in sols]
+        return control.optim_halfdirs(sols[control.rate_batch(control.encode_batch(sols)).argmin()])
+
+    def run(get):
+        lat = []
+        for _ in range(n_scrambles):
+            tick = time.time()
+            get()
+            lat.append(time.time() - tick)
+            time.sleep(.2) # robot executing
+        print('  %.2fms' % (1000 * sum(lat) / n_scrambles))
+
+    with solve.Solver(cmd) as solver:
+        print('on demand:')
+        run(lambda: select(solver.scramble()))
+        print('prefetched:')
+        with solve.ScramblePrefetcher(solver, select) as prefetcher:
+            prefetcher.resume()
+            time.sleep(.2) # initial fill
+            def get():
+                prefetcher.get()
+                prefetcher.resume()
+            run(get)
+
+# Time from a button press until the main loop reacts: old 50ms polling loop with two separate
+# reads vs. the button watcher
+def bench_buttons(n_presses=20):
+    device = sim.Brick()
+    brick = sim.connect(device)
+
+    def press(button):
+        time.sleep(random.uniform(.05, .1))
+        device.buttons[button] = 1
+        return time.time()
+
+    def run(wait):
+        lat = []
+        for i in range(n_presses):
+            button = i % 2
+            pressed = []
+            thread = threading.Thread(target=lambda: pressed.append(press(button)))
+            thread.start()
+            wait(button)
+            lat.append(time.time() - pressed[0])
+            thread.join()
+            device.buttons[button] = 0
+        print('  mean %.2fms, max %.2fms' % (1000 * sum(lat) / n_presses, 1000 * max(lat)))
+
+    def poll(_):
+        while True:
+            time.sleep(.05)
+            if control.is_pressed(brick, 1) or control.is_pressed(brick, 0):
+                return
+
+    print('polling:')
+    run(poll)
+    print('watcher:')
+    with control.ButtonWatcher(brick) as watcher:
+        def wait(button):
+            watcher.resume()
+            watcher.wait()
+            watcher.pause()
+        run(wait)
+
+# Execution of random solutions on simulated bricks (motors actually moving) compared to the expected
+# times from `turn.times`; all faces must end up aligned
+def bench_execute(n_sols=10, sol_len=20):
+    bricks = sim.sim_bricks()
+    robot = control.Robot(bricks)
+    sols = [random_sol(sol_len) for _ in range(n_sols)]
+    print('expected:  %.3fs' % (sum(control.expected_time(sol) for sol in sols) / n_sols))
+    tick = time.time()
+    for sol in sols:
+        stamps = robot.execute(sol).stamps
+    print('executed:  %.3fs' % ((time.time() - tick) / n_sols))
+    print('probed:    %d/%d moves' % (sum(s.done is not None for s in stamps), len(stamps)))
+    time.sleep(.1) # let the last moves finish
+    tachos = [brick._device.tacho(port) for brick in bricks for port in sim.PORTS]
+    print('aligned:   %s' % all(t % 54 == 0 for t in tachos))
+
+# Traced execution on simulated bricks: how much of a solve is spent in the bricks (waiting for
+# motors and USB round trips) vs. on the host; the trace is saved to `path` for closer inspection
+def bench_trace(sol_len=20, path='traces/bench.json'):
+    robot = control.Robot(sim.sim_bricks())
+    sol = random_sol(sol_len)
+    robot.execute(sol) # fill the command table
+    tracing.enable()
+    robot.execute(sol)
+    tracing.disable()
+
+    def total(name):
+        return sum(e['dur'] for e in tracing.EVENTS if e['name'] == name) / 1000
+    moves = sorted(
+        (e['ts'], e['ts'] + e['dur']) for e in tracing.EVENTS if e['name'].startswith('move')
+    )
+    busy = 0 # union of all move intervals
+    end = 0
+    for start, stop in moves:
+        busy += max(stop - max(start, end), 0)
+        end = max(end, stop)
+    print('execute %.2fms, bricks busy %.2fms, host %.2fms (compile %.3fms, USB writes %.3fms)' % (
+        total('execute'), busy / 1000, total('execute') - busy / 1000, total('compile'), total('write')
+    ))
+    tracing.save(path)
+    print('saved %s' % path)
+
+BENCHES = {
+    'demux': bench_demux,
+    'aio': bench_aio,
+    'cmds': bench_cmds,
+    'select': bench_select,
+    'failover': bench_failover,
+    'timeout': bench_timeout,
+    'cache': bench_cache,
+    'prefetch': bench_prefetch,
+    'buttons': bench_buttons,
+    'execute': bench_execute,
+    'trace': bench_trace
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHES:
+        print('== %s ==' % name)
+        BENCHES[name]()
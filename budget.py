@@ -0,0 +1,233 @@
+# Adaptive search budget: every millisecond of search is part of the solve time, so it is only worth
+# searching longer if this is expected to save more than that during execution. The solver CLI fixes
+# its time limit at startup, hence we keep one warmed up process per budget and solve with increasing
+# budgets, stopping as soon as a gain curve learned from previous solves (expected improvement of the
+# best expected execution time given the current one) falls below the cost of the next search.
+
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import pickle
+from threading import Thread
+import time
+
+from control import *
+from solve import *
+
+
+BUDGETS = [5, 25, 100] # search times of the individual solver processes in milliseconds
+GAINFILE = 'solve.gains'
+BIN_WIDTH = .02 # seconds of expected execution time aggregated in one bin of the gain curve
+MIN_SAMPLES = 10 # fewer observations are not trusted
+
+# Best expected execution time among the given solutions
+def best_time(sols):
+    return float(rate_batch(encode_batch([translate(sol) for sol in sols])).min())
+
+# Observed improvements from going from budget `i` to `i + 1` given the best expected time reached so
+# far, as well as the actual (wall-clock) duration of every step
+class GainCurve:
+
+    def __init__(self, budgets=BUDGETS):
+        self.budgets = list(budgets)
+        self.gains = [defaultdict(lambda: [0, 0.]) for _ in self.budgets[:-1]] # bin -> [count, sum]
+        self.times = [[0, 0.] for _ in self.budgets]
+
+    def __getstate__(self):
+        return (self.budgets, [dict(g) for g in self.gains], self.times)
+
+    def __setstate__(self, state):
+        self.budgets, gains, self.times = state
+        self.gains = [defaultdict(lambda: [0, 0.], g) for g in gains]
+
+    def add_time(self, i, t):
+        self.times[i][0] += 1
+        self.times[i][1] += t
+
+    def add_gain(self, i, q, q1):
+        stat = self.gains[i][int(q / BIN_WIDTH)]
+        stat[0] += 1
+        stat[1] += max(q - q1, 0)
+
+    # Expected duration of step `i`, the budget itself plus some overhead before we have any data
+    def cost(self, i):
+        n, total = self.times[i]
+        return total / n if n > 0 else self.budgets[i] / 1000
+
+    # Expected gain of step `i + 1` when `q` is the best time so far; falls back to the average over
+    # all bins if there is too little data for this particular one and is infinite (i.e. we always
+    # continue to collect data) if there is too little data overall
+    def gain(self, i, q):
+        n, total = self.gains[i][int(q / BIN_WIDTH)]
+        if n < MIN_SAMPLES:
+            n, total = map(sum, zip([0, 0.], *self.gains[i].values()))
+        return total / n if n >= MIN_SAMPLES else float('inf')
+
+    def worth(self, i, q):
+        return i + 1 < len(self.budgets) and self.gain(i, q) > self.cost(i + 1)
+
+def load_curve(budgets=BUDGETS, path=GAINFILE):
+    if os.path.exists(path):
+        curve = pickle.load(open(path, 'rb'))
+        if curve.budgets == list(budgets):
+            return curve
+    return GainCurve(budgets)
+
+# Drop-in replacement for a `Solver` (or `SolverPool`) with a per-cube search budget; the curve is
+# updated after every solve, but only written by `save()` as this should not add to the solve time.
+# A solver which fails (crashes or misses its tight timeout) ends the escalation, keeping the solutions
+# found so far, and is replaced in the background; `complete` tells whether the last solve went through.
+class AdaptiveSolver:
+
+    def __init__(self, budgets=BUDGETS, make_cmd=solver_cmd, path=GAINFILE, timeout=None):
+        self.solvers = [Solver(make_cmd(millis), timeout) for millis in budgets]
+        self.path = path
+        self.curve = load_curve(budgets, path)
+        self.spawning = set() # indices of solvers being replaced
+        self.closed = False
+        self.complete = True
+
+    def connect(self):
+        with ThreadPoolExecutor() as pool: # all warmups in parallel
+            list(pool.map(lambda solver: solver.connect(), self.solvers))
+        return self
+
+    def disconnect(self):
+        self.closed = True
+        for solver in self.solvers:
+            solver.disconnect()
+
+    # Warm up a replacement for the `i`-th solver in the background, it is skipped until then
+    def respawn(self, i):
+        if i in self.spawning:
+            return
+        self.spawning.add(i)
+
+        def run():
+            old = self.solvers[i]
+            try:
+                solver = Solver(old.cmd, old.timeout, old.warmup_timeout).connect()
+            except (SolverError, OSError):
+                solver = None # tried again on the next solve
+            if solver is not None:
+                if self.closed:
+                    solver.disconnect()
+                else:
+                    self.solvers[i] = solver
+                    old.disconnect()
+            self.spawning.discard(i)
+        Thread(target=run, daemon=True).start()
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.disconnect()
+
+    def solve(self, facecube):
+        if facecube == '':
+            return None
+        return list(self.iter_solve(facecube))
+
+    def iter_solve(self, facecube):
+        if facecube == '':
+            return
+        self.complete = True
+        qs = []
+        for i, solver in enumerate(self.solvers):
+            if not solver.alive():
+                self.respawn(i)
+                self.complete = False
+                continue # try the next budget in the meantime
+            tick = time.time()
+            sols = []
+            try:
+                for sol in solver.iter_solve(facecube):
+                    sols.append(sol)
+                    yield sol
+            except SolverError:
+                self.respawn(i)
+                self.complete = False
+                if sols or qs:
+                    break
+                continue # nothing found yet
+            self.curve.add_time(i, time.time() - tick)
+            if not sols:
+                break
+            qs.append(min(best_time(sols), qs[-1]) if qs else best_time(sols))
+            if not self.curve.worth(i, qs[-1]):
+                break
+        if self.complete: # gains are only attributed correctly if no budget was skipped
+            for i in range(len(qs) - 1):
+                self.curve.add_gain(i, qs[i], qs[i + 1])
+
+    def save(self):
+        pickle.dump(self.curve, open(self.path, 'wb'))
+
+    def scramble(self):
+        return self.solvers[-1].scramble() # scrambles are not timed
+
+
+# Offline evaluation: solves all given facecubes (file names in `scan/data` or lines of a text file)
+# with every budget and compares all fixed budgets to the adaptive policy with curves learned on the
+# other half of the cubes (2-fold cross-validation) in terms of search plus expected execution time.
+# Usage: python budget.py [scan/data | FILE] [SOLVER ...]
+if __name__ == '__main__':
+    import sys
+
+    src = sys.argv[1] if len(sys.argv) > 1 else 'scan/data'
+    if os.path.isdir(src):
+        facecubes = [f.split('.')[0] for f in sorted(os.listdir(src)) if f.endswith('.png')]
+    else:
+        facecubes = [l.strip() for l in open(src) if l.strip() != '']
+    cmd = (lambda millis: sys.argv[2:] + ['-m', str(millis)]) if len(sys.argv) > 2 else solver_cmd
+
+    ts, qs = [], []
+    solvers = [Solver(cmd(millis)) for millis in BUDGETS]
+    with ThreadPoolExecutor() as pool:
+        list(pool.map(lambda solver: solver.connect(), solvers))
+    try:
+        for facecube in facecubes:
+            ts.append([])
+            qs.append([])
+            for s in solvers:
+                tick = time.time()
+                sols = s.solve(facecube)
+                ts[-1].append(time.time() - tick)
+                qs[-1].append(best_time(sols) if sols else float('inf'))
+    finally:
+        for s in solvers:
+            s.disconnect()
+    ts, qs = np.array(ts), np.array(qs)
+    ok = np.isfinite(qs).all(1)
+    ts, qs = ts[ok], qs[ok]
+    print('%d cubes (%d failed)' % (len(ts), np.sum(~ok)))
+
+    def policy(curve, t, q):
+        best = q[0]
+        total = t[0]
+        for i in range(len(q) - 1):
+            if not curve.worth(i, best):
+                break
+            total += t[i + 1]
+            best = min(best, q[i + 1])
+        return total, best
+
+    folds = np.arange(len(ts)) % 2
+    res = []
+    for fold in range(2):
+        curve = GainCurve(BUDGETS)
+        for t, q in zip(ts[folds != fold], qs[folds != fold]):
+            for i in range(len(q)):
+                curve.add_time(i, t[i])
+            for i in range(len(q) - 1):
+                curve.add_gain(i, np.min(q[:(i + 1)]), np.min(q[:(i + 2)]))
+        res += [policy(curve, t, q) for t, q in zip(ts[folds == fold], qs[folds == fold])]
+    res = np.array(res)
+
+    print('budget      search    execution total')
+    for i, millis in enumerate(BUDGETS):
+        print('%-10s  %.4f    %.4f    %.4f' % (
+            '%dms' % millis, ts[:, i].mean(), qs[:, i].mean(), ts[:, i].mean() + qs[:, i].mean()
+        ))
+    print('%-10s  %.4f    %.4f    %.4f' % ('adaptive', res[:, 0].mean(), res[:, 1].mean(), res.sum(1).mean()))
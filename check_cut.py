@@ -0,0 +1,155 @@
+# Checks the dense transition-class table: every entry of `CUT_TABLE` (and thus `cut()`) must match
+# the outputs of the original recursive `cut()` it replaced, frozen below (one row per move in `MOVES`
+# order, one hex digit per class), as well as the checksum of that table. Update both only for
+# intended changes of the cut classes.
+# Usage: python check_cut.py
+
+import hashlib
+import sys
+
+import numpy as np
+
+from control import *
+
+
+CUT_SHA1 = 'd7f7a7c5eb11ffb01c65b11669e95f7b5c3f05ee' # of the int8 table in `MOVES` order
+
+FROZEN = [
+    '110011001100110011001100614016144120040261401614412004026140161441200402614016144120040261401614412004026140161441200402',
+    '110011001100110011001100614016144120040261401614412004026140161441200402614016144120040261401614412004026140161441200402',
+    '001100110011001100110011204102044061141620410204406114162041020440611416204102044061141620410204406114162041020440611416',
+    '001100110011001100110011204102044061141620410204406114162041020440611416204102044061141620410204406114162041020440611416',
+    '110011001100110011001100614016144120040261401614412004026140161441200402614016144120040261401614412004026140161441200402',
+    '110011001100110011001100614016144120040261401614412004026140161441200402614016144120040261401614412004026140161441200402',
+    '001100110011001100110011204102044061141620410204406114162041020440611416204102044061141620410204406114162041020440611416',
+    '001100110011001100110011204102044061141620410204406114162041020440611416204102044061141620410204406114162041020440611416',
+    '110011001100110011001100614016144120040261401614412004026140161441200402614016144120040261401614412004026140161441200402',
+    '110011001100110011001100614016144120040261401614412004026140161441200402614016144120040261401614412004026140161441200402',
+    '001100110011001100110011204102044061141620410204406114162041020440611416204102044061141620410204406114162041020440611416',
+    '001100110011001100110011204102044061141620410204406114162041020440611416204102044061141620410204406114162041020440611416',
+    '110011001100110011001100614016144120040261401614412004026140161441200402614016144120040261401614412004026140161441200402',
+    '110011001100110011001100614016144120040261401614412004026140161441200402614016144120040261401614412004026140161441200402',
+    '001100110011001100110011204102044061141620410204406114162041020440611416204102044061141620410204406114162041020440611416',
+    '001100110011001100110011204102044061141620410204406114162041020440611416204102044061141620410204406114162041020440611416',
+    '110011001100110011001100614016144120040261401614412004026140161441200402614016144120040261401614412004026140161441200402',
+    '110011001100110011001100614016144120040261401614412004026140161441200402614016144120040261401614412004026140161441200402',
+    '001100110011001100110011204102044061141620410204406114162041020440611416204102044061141620410204406114162041020440611416',
+    '001100110011001100110011204102044061141620410204406114162041020440611416204102044061141620410204406114162041020440611416',
+    '110011001100110011001100614016144120040261401614412004026140161441200402614016144120040261401614412004026140161441200402',
+    '110011001100110011001100614016144120040261401614412004026140161441200402614016144120040261401614412004026140161441200402',
+    '001100110011001100110011204102044061141620410204406114162041020440611416204102044061141620410204406114162041020440611416',
+    '001100110011001100110011204102044061141620410204406114162041020440611416204102044061141620410204406114162041020440611416',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '773377337733773377337733aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '555555555555555555555555999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999999',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+    '33773377337733773377337788aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa88aa88aaaaaaaaaa',
+]
+
+
+if __name__ == '__main__':
+    errors = 0
+    for i, m1 in enumerate(MOVES):
+        for j, m2 in enumerate(MOVES):
+            expected = int(FROZEN[i][j], 16)
+            got = (CUT_TABLE[i, j], cut(m1, m2))
+            if any(c != expected for c in got):
+                print('%s -> %s: expected %d, got %s (table, cut)' % (m1, m2, expected, got))
+                errors += 1
+    print('%d/%d pairs ok.' % (len(MOVES) ** 2 - errors, len(MOVES) ** 2))
+    sha1 = hashlib.sha1(CUT_TABLE.astype(np.int8).tobytes()).hexdigest()
+    if sha1 != CUT_SHA1:
+        print('Table checksum %s differs from the original %s.' % (sha1, CUT_SHA1))
+        errors += 1
+    sys.exit(errors > 0)
@@ -58,28 +58,28 @@ def some_port(ports):
     return 1 << ((ports & -ports).bit_length() - 1)
 
 # Peform a single face move
-def rotate(brick, ports, deg, waitdeg):
+def cmd_move(ports, deg, waitdeg):
     waitport = some_port(ports)
     cmd = cmd_ready(ports)
     cmd += cmd_waitdeg_target(deg, waitport, waitdeg, 0)
     cmd += cmd_rotate(ports, deg)
     cmd += cmd_waitdeg_wait(deg, waitport, 0, 4)
-    brick.send_direct_cmd(cmd, global_mem=8)
+    return cmd
 
 # Perform an axial move where both sides are rotated by the same abs-degrees
-def rotate1(brick, ports1, ports2, deg1, deg2, waitdeg):
+def cmd_move1(ports1, ports2, deg1, deg2, waitdeg):
     waitport = some_port(ports2)
     cmd = cmd_ready(ports1 + ports2)
     cmd += cmd_waitdeg_target(deg2, waitport, waitdeg, 0)
     cmd += cmd_rotate(ports1, deg1)
     cmd += cmd_rotate(ports2, deg2)
     cmd += cmd_waitdeg_wait(deg2, waitport, 0, 4)
-    brick.send_direct_cmd(cmd, global_mem=8)
+    return cmd
 
 # Perform an axial move where one side is a half-turn and the other a quarter-turn.
 # In this case we want to start the latter turn a little later so that they both
 # end jointly and are thus automatically aligned by the next move.
-def rotate2(brick, ports1, ports2, deg1, deg2, waitdeg1, waitdeg2):
+def cmd_move2(ports1, ports2, deg1, deg2, waitdeg1, waitdeg2):
     waitport = some_port(ports1)
     cmd = cmd_ready(ports1 + ports2)
     cmd += cmd_waitdeg_target(deg1, waitport, waitdeg1, 0)
@@ -88,17 +88,45 @@ def rotate2(brick, ports1, ports2, deg1, deg2, waitdeg1, waitdeg2):
     cmd += cmd_waitdeg_wait(deg1, waitport, 0, 8)
     cmd += cmd_rotate(ports2, deg2)
     cmd += cmd_waitdeg_wait(deg1, waitport, 4, 8)
-    brick.send_direct_cmd(cmd, global_mem=12)
+    return cmd
 
-# Check if a button is pressed
-def is_pressed(brick, port):
-    cmd = b''.join([
+# Global memory the move commands need for their tacho variables
+MOVE_MEM = 8
+MOVE2_MEM = 12
+
+def rotate(brick, ports, deg, waitdeg):
+    brick.send_direct_cmd(cmd_move(ports, deg, waitdeg), global_mem=MOVE_MEM)
+
+def rotate1(brick, ports1, ports2, deg1, deg2, waitdeg):
+    brick.send_direct_cmd(cmd_move1(ports1, ports2, deg1, deg2, waitdeg), global_mem=MOVE_MEM)
+
+def rotate2(brick, ports1, ports2, deg1, deg2, waitdeg1, waitdeg2):
+    brick.send_direct_cmd(
+        cmd_move2(ports1, ports2, deg1, deg2, waitdeg1, waitdeg2), global_mem=MOVE2_MEM
+    )
+
+# Read the state of a button (touch sensor) into global variable `var`
+def cmd_pressed(port, var):
+    return b''.join([
         ev3.opInput_Read,
         ev3.LCX(0),
         ev3.LCX(port),
         ev3.LCX(16),
         ev3.LCX(0),
-        ev3.GVX(0) 
+        ev3.GVX(var) 
     ])
-    return struct.unpack('<b', brick.send_direct_cmd(cmd, global_mem=1)[5:])[0] > 0
+
+def pressed(reply):
+    return struct.unpack('<b', reply[5:6])[0] > 0
+
+# Check if a button is pressed
+def is_pressed(brick, port):
+    return pressed(brick.send_direct_cmd(cmd_pressed(port, 0), global_mem=1))
+
+# Read the states of several buttons with a single command, the `i`-th one into global variable `i`
+def cmd_buttons(ports):
+    return b''.join([cmd_pressed(port, i) for i, port in enumerate(ports)])
+
+def buttons(reply, n):
+    return [b > 0 for b in struct.unpack('<%db' % n, reply[5:(5 + n)])]
 
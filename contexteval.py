@@ -0,0 +1,52 @@
+# Offline evaluation of the second-order (context) timing model against the pairwise one: both are
+# fit on the older solves in the log and then predict the move times of the newer ones.
+# Usage: python contexteval.py [fraction of solves used for fitting]
+
+import sys
+
+import numpy as np
+
+from control import *
+import solvelog
+
+
+frac = float(sys.argv[1]) if len(sys.argv) > 1 else .8
+
+log = solvelog.load()
+n_solves = log['solve'].max() + 1 if len(log) > 0 else 0
+split = int(frac * n_solves)
+train, test = log[log['solve'] < split], log[log['solve'] >= split]
+print('%d solves for fitting, %d (%d moves) for testing' % (split, n_solves - split, len(test)))
+
+# Pairwise model
+keys, last = solvelog.pair_keys(train)
+cut_med = solvelog.group_medians(keys[~last], train['duration'][~last], 2 * N_CLASSES)
+end_med = solvelog.group_medians(keys[last], train['duration'][last], 4)
+keys, last = solvelog.pair_keys(test)
+pred_pair = np.where(last, end_med[np.minimum(keys, 3)], cut_med[keys])
+
+# Context model with fallback to the pairwise one for sparse contexts (as `control.load_context()`)
+(cut_ctx, cut_cnt), (end_ctx, end_cnt) = solvelog.context_medians(train)
+prev = solvelog.prev_classes(test)
+cls = np.maximum(test['cls'], 0)
+half, axial = test['half'].astype(int), test['axial'].astype(int)
+pred_ctx = np.where(
+    last,
+    np.where(end_cnt[prev, axial, half] >= MIN_CONTEXT, end_ctx[prev, axial, half], pred_pair),
+    np.where(cut_cnt[prev, cls, half] >= MIN_CONTEXT, cut_ctx[prev, cls, half], pred_pair)
+)
+
+def report(name, pred):
+    err = pred - test['duration']
+    ok = np.isfinite(err)
+    totals = np.bincount(test['solve'][ok] - split, err[ok])
+    print('%-9s move MAE %.2fms, RMSE %.2fms, solve MAE %.2fms (%d unpredictable moves)' % (
+        name, 1000 * np.abs(err[ok]).mean(), 1000 * np.sqrt((err[ok] ** 2).mean()),
+        1000 * np.abs(totals).mean(), np.sum(~ok)
+    ))
+
+report('pairwise', pred_pair)
+report('context', pred_ctx)
+print('%.1f%% of the test moves in contexts with enough samples' % (100 * np.mean(np.where(
+    last, end_cnt[prev, axial, half], cut_cnt[prev, cls, half]
+) >= MIN_CONTEXT)))
@@ -1,10 +1,18 @@
 # Robot control.
 
+from array import array
 from cmd import *
 from collections import namedtuple
+import os
 import pickle
+from queue import Queue, Empty
+from threading import Event, Lock, Thread
 import time
+
+import numpy as np
+
 import ev3
+import tracing
 
 
 # We also consider inverted half-moves here (thus %/ 4 instead of 3)
@@ -37,12 +45,16 @@ AX_ANTICUT2 = 7
 AXAX_CUT = 8
 AXAX_PARTCUT = 9
 AXAX_ANTICUT = 10
+N_CLASSES = 11
+NO_CLASS = 11 # previous class of the first move
+INVALID_CLASS = 12 # transitions from or to missing options in batches
 
-def cut(m1, m2, inverted=False):
+# Reference definition of the cut classes; only used to build `CUT_TABLE` below
+def compute_cut(m1, m2, inverted=False):
     if is_axial(m1) and not is_axial(m2):
-        return cut(m2, m1, inverted=True) + 1
+        return compute_cut(m2, m1, inverted=True) + 1
     if is_axial(m1) and is_axial(m2):
-        return AXAX_CUT + (max(cut(m1, m2[0]), cut(m1, m2[1])) // 2 - 1)
+        return AXAX_CUT + (max(compute_cut(m1, m2[0]), compute_cut(m1, m2[1])) // 2 - 1)
     
     if not is_axial(m2):
         return CUT if is_clock(m1) != is_clock(m2) else ANTICUT
@@ -66,6 +78,59 @@ def cut(m1, m2, inverted=False):
     return AX_PARTCUT1
 
 
+# Dense index of all move encodings: 24 simple moves (incl. inverted half-turns) followed by all
+# 96 axial moves (both side orders, as execution may swap them)
+MOVES = list(range(24)) + [
+    (4 * f + c1, 4 * (f ^ 1) + c2) for f in range(6) for c1 in range(4) for c2 in range(4)
+]
+MOVE_INDEX = {m: i for i, m in enumerate(MOVES)}
+
+CUT_TABLE = np.array([[compute_cut(m1, m2) for m2 in MOVES] for m1 in MOVES], dtype=np.int8)
+HALF = np.array([is_half(m) for m in MOVES], dtype=np.int8)
+AXIAL = np.array([is_axial(m) for m in MOVES], dtype=np.int8)
+
+# Half-turn direction options of every move (as indices), the move itself always comes first
+def halfdir_options(m):
+    if is_axial(m):
+        m1, m2 = m
+        options = [m]
+        if is_half(m1):
+            options.append((inv2(m1), m2))
+        if is_half(m2):
+            options.append((m1, inv2(m2)))
+        if is_half(m1) and is_half(m2):
+            options.append((inv2(m1), inv2(m2)))
+    else:
+        options = [m]
+        if is_half(m):
+            options.append(inv2(m))
+    return [MOVE_INDEX[op] for op in options]
+
+OPTIONS = [halfdir_options(m) for m in MOVES]
+
+PAD = len(MOVES) # padding for batches of solutions with different lengths
+# `OPTIONS` padded to always 4 options with -1; padding moves can only stay padding
+OPTIONS_TABLE = np.full((len(MOVES) + 1, 4), -1, dtype=np.int16)
+for i, options in enumerate(OPTIONS):
+    OPTIONS_TABLE[i, :len(options)] = options
+OPTIONS_TABLE[PAD, 0] = PAD
+
+def encode(sol):
+    return [MOVE_INDEX[m] for m in sol]
+
+# Pack many solutions into a single array for batch processing; shorter ones are aligned to the end
+# and padded at the front with `PAD`
+def encode_batch(sols):
+    batch = np.full((len(sols), max([len(sol) for sol in sols], default=0)), PAD, dtype=np.int16)
+    for i, sol in enumerate(sols):
+        if len(sol) > 0:
+            batch[i, -len(sol):] = encode(sol)
+    return batch
+
+def cut(m1, m2):
+    return CUT_TABLE.item(MOVE_INDEX[m1], MOVE_INDEX[m2])
+
+
 # [][0] for quarter- and [][1] for half-turns
 WAITDEG = [
     [12, 52], # CUT
@@ -102,37 +167,147 @@ SPECIAL_AX_WAITDEG = 5
 # The waitdegs are not directly proportional to the actual execution speed. Thus
 # it is better to do half-turn direction optimization and solution selection
 # based on actual (collected) timing data
-CUTTIMES, ENDTIMES = pickle.load(open('turn.times', 'rb'))
-
-def expected_time(sol):
+TIMESFILE = 'turn.times' # per class medians
+STATSFILE = 'turn.stats' # per class means, variances and lockup rates (optional)
+
+OBJECTIVES = ['median', 'mean', 'p90', 'context']
+Z90 = 1.2816 # 90% quantile of the standard normal distribution
+PDF90 = 0.1755 # density of the standard normal distribution at `Z90`
+TYPICAL_LEN = 20 # moves in a typical solution
+
+# Additive move costs under every objective as (cut times, end times, transition cost table, end cost
+# table) where the latter two are the same timings on the dense move index for batch processing; the
+# extra last row/column of the transition costs is for missing options (-1).
+# 'median' is the sum of the per-move medians, i.e. the time of a solution without any lockups; this
+# is not the median of the total, which for ~20 independent moves is (central limit theorem) close to
+# the sum of the means, i.e. the 'mean' objective.
+# The p90 of a solution's total time is approximately mean + Z90 * std under a normal approximation;
+# linearizing the square root around the variance of a typical solution turns it into an additive
+# per-move cost of mean + lambda * variance. Lockups are far out in the tail where the normal
+# approximation does not hold, hence we model the total as that normal plus a rare large lockup
+# penalty: raising the probability of one by p moves the p90 by about p * 0.9 * std / PDF90 (the
+# lockup pushes the total beyond the quantile in 90% of the cases in which there would otherwise be
+# none). All of this stays additive per move, so we can optimize with exactly the same DPs as the
+# median.
+TIMES = {}
+for objective in OBJECTIVES[:-1]:
+    TIMES[objective] = ([], [], np.full((PAD + 2, PAD + 2), float('inf')), np.zeros(PAD + 1))
+    TIMES[objective][2][PAD, :(PAD + 1)] = 0 # leading padding is free
+CUTTIMES, ENDTIMES, COST_TABLE, END_TABLE = TIMES['median']
+STATS = {} # 'mean', 'var', 'lockup' -> (cut table, end table)
+
+def set_times(objective, cuttimes, endtimes):
+    cut, end, cost_table, end_table = TIMES[objective]
+    cut[:], end[:] = cuttimes, endtimes
+    cost_table[:PAD, :PAD] = np.array(cut)[CUT_TABLE, HALF[:, None]]
+    end_table[:PAD] = np.array(end)[AXIAL, HALF]
+
+CONTEXTFILE = 'turn.context' # medians and counts per context (optional)
+MIN_CONTEXT = 10 # contexts with fewer samples fall back to the pairwise medians
+
+# Second-order model ('context' objective): the time of a move also depends on the cut class of the
+# transition from the previous move, i.e. [prev][cls][is_half] (prev is `NO_CLASS` for the first move)
+# and [prev][is_axial][is_half] for the last move
+CTX_CUTTIMES = np.zeros((N_CLASSES + 1, N_CLASSES, 2))
+CTX_ENDTIMES = np.zeros((N_CLASSES + 1, 2, 2))
+
+# The same for batches: classes of all transitions on the dense move index including padding (which
+# has no class) and missing options (-1, invalid) and the context costs of those with an extra
+# is_half value of 2 for padding moves (which are free)
+CLS_TABLE = np.full((PAD + 2, PAD + 2), INVALID_CLASS, dtype=np.int8)
+CLS_TABLE[:PAD, :PAD] = CUT_TABLE
+CLS_TABLE[PAD, :(PAD + 1)] = NO_CLASS
+HALF_TABLE = np.full(PAD + 2, 2, dtype=np.int8)
+HALF_TABLE[:PAD] = HALF
+AXIAL_TABLE = np.zeros(PAD + 2, dtype=np.int8)
+AXIAL_TABLE[:PAD] = AXIAL
+CTX_COST_TABLE = np.full((N_CLASSES + 2, N_CLASSES + 2, 3), float('inf'))
+CTX_COST_TABLE[:, :INVALID_CLASS, 2] = 0
+CTX_END_TABLE = np.full((N_CLASSES + 2, 2, 3), float('inf'))
+CTX_END_TABLE[:INVALID_CLASS, :, 2] = 0
+
+def load_context():
+    CTX_CUTTIMES[:] = np.array(CUTTIMES)[None]
+    CTX_ENDTIMES[:] = np.array(ENDTIMES)[None]
+    if os.path.exists(CONTEXTFILE):
+        (cut_med, cut_cnt), (end_med, end_cnt) = pickle.load(open(CONTEXTFILE, 'rb'))
+        mask = np.array(cut_cnt) >= MIN_CONTEXT
+        CTX_CUTTIMES[mask] = np.array(cut_med)[mask]
+        mask = np.array(end_cnt) >= MIN_CONTEXT
+        CTX_ENDTIMES[mask] = np.array(end_med)[mask]
+    CTX_COST_TABLE[:(N_CLASSES + 1), :N_CLASSES, :2] = CTX_CUTTIMES
+    CTX_END_TABLE[:(N_CLASSES + 1), :, :2] = CTX_ENDTIMES
+
+def mtimes():
+    return tuple(
+        os.stat(f).st_mtime_ns if os.path.exists(f) else None for f in [TIMESFILE, STATSFILE, CONTEXTFILE]
+    )
+
+# (Re)load all timing tables; everything is updated in place so that references other modules hold
+# (e.g. through `from control import *`) stay valid
+def load_times():
+    global TIMES_MTIME
+    TIMES_MTIME = mtimes()
+    set_times('median', *pickle.load(open(TIMESFILE, 'rb')))
+    if os.path.exists(STATSFILE):
+        STATS.update(pickle.load(open(STATSFILE, 'rb')))
+    else: # only medians known, assume no spread at all
+        zeros = ([[0, 0] for _ in CUTTIMES], [[0, 0] for _ in ENDTIMES])
+        STATS.update({'mean': (CUTTIMES, ENDTIMES), 'var': zeros, 'lockup': zeros})
+    set_times('mean', *STATS['mean'])
+
+    var = np.concatenate([np.ravel(STATS['var'][0]), np.ravel(STATS['var'][1])])
+    var = var[np.isfinite(var)]
+    std = np.sqrt(TYPICAL_LEN * var.mean()) if len(var) > 0 else 0
+    lam = Z90 / (2 * std) if std > 0 else 0
+    kappa = .9 * std / PDF90
+    set_times('p90', *[
+        (np.array(mean) + lam * np.array(var) + kappa * np.array(lockup)).tolist()
+            for mean, var, lockup in zip(STATS['mean'], STATS['var'], STATS['lockup'])
+    ])
+    load_context()
+
+# Pick up timings which have changed on disk (e.g. updated by `timing.py`); returns whether it did
+def reload_times():
+    if mtimes() == TIMES_MTIME:
+        return False
+    load_times()
+    return True
+
+load_times()
+
+def expected_time(sol, objective='median'):
     if len(sol) == 0:
         return 0
+    if objective == 'context':
+        return context_time(sol)
+    cuttimes, endtimes, _, _ = TIMES[objective]
+    sol = encode(sol)
     time = 0
     for i in range(len(sol) - 1):
-        time += CUTTIMES[cut(sol[i], sol[i + 1])][int(is_half(sol[i]))]
-    time += ENDTIMES[int(is_axial(sol[-1]))][int(is_half(sol[-1]))]
+        time += cuttimes[CUT_TABLE.item(sol[i], sol[i + 1])][HALF.item(sol[i])]
+    time += endtimes[AXIAL.item(sol[-1])][HALF.item(sol[-1])]
+    return time
+
+def context_time(sol):
+    sol = encode(sol)
+    time = 0
+    prev = NO_CLASS
+    for i in range(len(sol) - 1):
+        cls = CUT_TABLE.item(sol[i], sol[i + 1])
+        time += CTX_CUTTIMES.item(prev, cls, HALF.item(sol[i]))
+        prev = cls
+    time += CTX_ENDTIMES.item(prev, AXIAL.item(sol[-1]), HALF.item(sol[-1]))
     return time
 
 # Determine optimal turning directions for half-turns with respect to corner cutting
-def optim_halfdirs(sol):
+def optim_halfdirs(sol, objective='median'):
     if len(sol) == 0:
         return sol
-
-    options = [[] for _ in range(len(sol))]
-    for i in range(len(sol)):
-        if is_axial(sol[i]):
-            m1, m2 = sol[i]
-            options[i].append(sol[i])
-            if is_half(m1):
-                options[i].append((inv2(m1), m2))
-            if is_half(m2):
-                options[i].append((m1, inv2(m2)))
-            if is_half(m1) and is_half(m2):
-                options[i].append((inv2(m1), inv2(m2)))
-        else:
-            options[i].append(sol[i])
-            if is_half(sol[i]):
-                options[i].append(inv2(sol[i]))
+    options = [OPTIONS[i] for i in encode(sol)]
+    if objective == 'context':
+        return optim_halfdirs_context(options)
+    cuttimes = TIMES[objective][0]
 
     # Dynamic programming to find the actual optimal maneuvers instead of just an approximation
 
@@ -143,7 +318,7 @@ def optim_halfdirs(sol):
     for i in range(1, len(sol)):
         for j, op2 in enumerate(options[i]):
             for k, op1 in enumerate(options[i - 1]):
-                tmp = DP[i - 1][k] + CUTTIMES[cut(op1, op2)][int(is_half(op1))]
+                tmp = DP[i - 1][k] + cuttimes[CUT_TABLE.item(op1, op2)][HALF.item(op1)]
                 if tmp < DP[i][j]:
                     DP[i][j] = tmp
                     PD[i][j] = k
@@ -157,10 +332,82 @@ def optim_halfdirs(sol):
         j = PD[i][j]
         sol1.append(options[i - 1][j])
     sol1.reverse()
-    return sol1
+    return [MOVES[i] for i in sol1]
+
+# Same DP for the context model, only that its states are now the options of two consecutive moves
+def optim_halfdirs_context(options):
+    if len(options) == 1:
+        return [MOVES[options[0][0]]] # directions of the last move do not matter
+
+    DP = {
+        (j, k): CTX_CUTTIMES.item(NO_CLASS, CUT_TABLE.item(op1, op2), HALF.item(op1))
+        for j, op1 in enumerate(options[0]) for k, op2 in enumerate(options[1])
+    }
+    PD = [] # for every step: state -> best option of the move before
+    for i in range(1, len(options) - 1):
+        DP1 = {}
+        PD.append({})
+        for (j, k), tmp in DP.items():
+            op1, op2 = options[i - 1][j], options[i][k]
+            prev = CUT_TABLE.item(op1, op2)
+            for l, op3 in enumerate(options[i + 1]):
+                tmp1 = tmp + CTX_CUTTIMES.item(prev, CUT_TABLE.item(op2, op3), HALF.item(op2))
+                if tmp1 < DP1.get((k, l), float('inf')):
+                    DP1[(k, l)] = tmp1
+                    PD[-1][(k, l)] = j
+        DP = DP1
+
+    def end(j, k):
+        op1, op2 = options[-2][j], options[-1][k]
+        return CTX_ENDTIMES.item(CUT_TABLE.item(op1, op2), AXIAL.item(op2), HALF.item(op2))
+    j, k = min(DP, key=lambda state: DP[state] + end(*state))
+    sol1 = [options[-1][k], options[-2][j]]
+    for i in range(len(PD) - 1, -1, -1):
+        j, k = PD[i][(j, k)], j
+        sol1.append(options[i][j])
+    sol1.reverse()
+    return [MOVES[i] for i in sol1]
+
+# Same as `expected_time(optim_halfdirs(sol))` but for a whole batch of solutions at once (as given by
+# `encode_batch()`); the DP runs vectorized over all candidates and is only sequential in the moves.
+def rate_batch(batch, objective='median'):
+    n_sols, n_moves = batch.shape
+    if n_moves == 0:
+        return np.zeros(n_sols)
+    if objective == 'context':
+        return rate_batch_context(batch)
+    _, _, COST_TABLE, END_TABLE = TIMES[objective]
+    options = OPTIONS_TABLE[batch]
+    DP = np.where(options[:, 0] >= 0, 0., float('inf'))
+    for i in range(1, n_moves):
+        DP = (DP[:, :, None] + COST_TABLE[options[:, i - 1, :, None], options[:, i, None, :]]).min(1)
+    return DP.min(1) + END_TABLE[batch[:, -1]]
+
+def rate_batch_context(batch):
+    options = OPTIONS_TABLE[batch]
+    if batch.shape[1] == 1:
+        return CTX_END_TABLE[NO_CLASS, AXIAL_TABLE[batch[:, 0]], HALF_TABLE[batch[:, 0]]]
+    op1, op2 = options[:, 0, :, None], options[:, 1, None, :]
+    DP = CTX_COST_TABLE[NO_CLASS, CLS_TABLE[op1, op2], HALF_TABLE[op1]] # states: options of 2 moves
+    for i in range(2, batch.shape[1]):
+        op1 = options[:, i - 2, :, None, None]
+        op2 = options[:, i - 1, None, :, None]
+        op3 = options[:, i, None, None, :]
+        cost = CTX_COST_TABLE[CLS_TABLE[op1, op2], CLS_TABLE[op2, op3], HALF_TABLE[op2]]
+        DP = (DP[:, :, :, None] + cost).min(1)
+    op1, op2 = options[:, -2, :, None], options[:, -1, None, :]
+    return (DP + CTX_END_TABLE[CLS_TABLE[op1, op2], AXIAL_TABLE[op2], HALF_TABLE[op2]]).min((1, 2))
 
 
 Motor = namedtuple('Motor', ['brick', 'ports'])
+# A fully assembled direct command ready to be sent to its brick
+Command = namedtuple('Command', ['brick', 'ops', 'global_mem'])
+# Compiled solution: per move brick index, command bytes, global memory and the command probing for the
+# move's motors to be done (or None)
+Plan = namedtuple('Plan', ['bricks', 'cmds', 'mems', 'probes'])
+# Timestamps (`time.perf_counter_ns()`) of an executed move: command sent, reply received (i.e. its
+# waitdeg was reached and the next move released) and motors done (None if not measured)
+Stamps = namedtuple('Stamps', ['send', 'ack', 'done'])
 DEGS = [54, 108, -54, -108] # double inversion from motor perspective + gearing
 
 HOSTS = [
@@ -178,70 +425,260 @@ FACE_TO_MOTOR = [
     Motor(1, ev3.PORT_A + ev3.PORT_B)  # B
 ]
 
-class Robot:
+# The direct command of a move depends only on the move itself (with the sides of an axial move already
+# in execution order) and on the cut class of the transition to the next move (None for the last move).
+# There are thus only a few hundred different ones which we compile once and then simply look up.
+
+def compile_move(m, cls):
+    motor = FACE_TO_MOTOR[m // 4]
+    deg = DEGS[m % 4]
+
+    if cls is None:
+        # NOTE: Cube can be considered solved once the final turn is < 45 degrees before completion
+        waitdeg = abs(deg) - (27 - 1)
+    else:
+        waitdeg = WAITDEG[cls][int(is_half(m))]
+
+    return Command(motor.brick, cmd_move(motor.ports, deg, waitdeg), MOVE_MEM)
+
+def compile_move1(m, cls):
+    m1, m2 = m
+    motor1, motor2 = FACE_TO_MOTOR[m1 // 4], FACE_TO_MOTOR[m2 // 4]
+    count1, count2 = m1 % 4, m2 % 4
+    deg1, deg2 = DEGS[count1], DEGS[count2]
+
+    if cls is None:
+        waitdeg = max(abs(deg1), abs(deg2)) - (27 - 1)
+    else:
+        waitdeg = WAITDEG[cls][int(is_half(m))]
+
+    # Half + quarter-turn case (the half-turn always comes first)
+    if (count1 & 1) != (count2 & 1):
+        return Command(
+            motor1.brick, 
+            cmd_move2(motor1.ports, motor2.ports, deg1, deg2, SPECIAL_AX_WAITDEG, waitdeg),
+            MOVE2_MEM
+        )
+    return Command(motor1.brick, cmd_move1(motor1.ports, motor2.ports, deg1, deg2, waitdeg), MOVE_MEM)
+
+CMDS = {} # (move, cut class) -> `Command`, filled lazily
+PROBES = {} # ports -> command replying once all these motors are done
+
+def move_ports(m):
+    if is_axial(m):
+        return FACE_TO_MOTOR[m[0] // 4].ports + FACE_TO_MOTOR[m[1] // 4].ports
+    return FACE_TO_MOTOR[m // 4].ports
+
+def probe_cmd(m):
+    ports = move_ports(m)
+    if ports not in PROBES:
+        PROBES[ports] = cmd_ready(ports)
+    return PROBES[ports]
+def move_cmd(m, cls):
+    key = (m, cls)
+    if key not in CMDS:
+        with tracing.span('build', 'cmd', move=str(m), cls=cls):
+            CMDS[key] = compile_move1(m, cls) if is_axial(m) else compile_move(m, cls)
+    return CMDS[key]
+
+
+# Per move durations (as collected for the timing model) which also carry the `Stamps` of every move
+class MoveTimes(list):
+
+    def __init__(self, times, stamps):
+        super().__init__(times)
+        self.stamps = stamps
 
-    def __init__(self):
-        self.bricks = [
-            ev3.EV3(protocol='Usb', host=host) for host in HOSTS
-        ]
 
-    def move(self, m, prev, next):
-        motor = FACE_TO_MOTOR[m // 4]
-        deg = DEGS[m % 4]
+class Robot:
 
-        if next is None:
-            # NOTE: Cube can be considered solved once the final turn is < 45 degrees before completion
-            waitdeg = abs(deg) - (27 - 1)
-        else:
-            waitdeg = WAITDEG[cut(m, next)][int(is_half(m))]
+    def __init__(self, bricks=None):
+        if bricks is None:
+            bricks = [ev3.EV3(protocol='Usb', host=host) for host in HOSTS]
+        self.bricks = bricks
 
-        rotate(self.bricks[motor.brick], motor.ports, deg, waitdeg)
+    def move(self, m, prev, next):
+        return move_cmd(m, None if next is None else cut(m, next))
 
     def move1(self, m, prev, next):
         m1, m2 = m
-        motor1, motor2 = FACE_TO_MOTOR[m1 // 4], FACE_TO_MOTOR[m2 // 4]
-        count1, count2 = m1 % 4, m2 % 4
-        deg1, deg2 = DEGS[count1], DEGS[count2]
-    
-        if next is None:
-            waitdeg = max(abs(deg1), abs(deg2)) - (27 - 1)
-        else:
-            waitdeg = WAITDEG[cut(m, next)][int(is_half(m))]
-
-        # Half + quarter-turn case
-        if (count1 & 1) != (count2 & 1):
-            if (count2 & 1) != 0:
-                return self.move1((m2, m1), prev, next)
-            rotate2(
-                self.bricks[motor1.brick], motor1.ports, motor2.ports, deg1, deg2,
-                SPECIAL_AX_WAITDEG, waitdeg
-            )
+        if (m1 & 1) != (m2 & 1):
+            if (m2 & 1) != 0: # quarter-turn should wait for the half-turn
+                m = (m2, m1)
         else:
             # We always want to wait on the move with the worse in-cutting
             if prev is not None and WAITDEG[cut(prev, m1)] > WAITDEG[cut(prev, m2)]:
-                return self.move1((m2, m1), prev, next)
-            rotate1(self.bricks[motor1.brick], motor1.ports, motor2.ports, deg1, deg2, waitdeg)
+                m = (m2, m1)
+        return move_cmd(m, None if next is None else cut(m, next))
+
+    # Assemble the direct command for the `i`-th move of `sol`
+    def command(self, sol, i):
+        prev = sol[i - 1] if i > 0 else None
+        next = sol[i + 1] if i < len(sol) - 1 else None
+        if is_axial(sol[i]):
+            return self.move1(sol[i], prev, next)
+        return self.move(sol[i], prev, next)
+
+    # Everything about executing `sol` is known in advance; we thus compile it into a flat plan
+    # so that the timing critical loop does nothing but sending commands and collecting replies
+    def compile(self, sol):
+        cmds = [self.command(sol, i) for i in range(len(sol))]
+        return Plan(
+            array('b', [c.brick for c in cmds]),
+            [c.ops for c in cmds],
+            array('b', [c.global_mem for c in cmds]),
+            self.probes(sol, cmds)
+        )
+
+    # The probe for a move holds back all later commands of its brick until the move is done. This
+    # costs nothing if the next command of the brick waits for the same motors anyway, otherwise we
+    # do not probe (and thus do not know when exactly the move is done). The last move of every
+    # brick is not probed either as execution would then only end once its motors are done.
+    def probes(self, sol, cmds):
+        probes = [None] * len(sol)
+        for i in range(len(sol) - 1):
+            if cmds[i + 1].brick == cmds[i].brick:
+                continue # the probe could only be sent after the next move
+            j = next((j for j in range(i + 1, len(sol)) if cmds[j].brick == cmds[i].brick), None)
+            if j is not None and move_ports(sol[i]) & ~move_ports(sol[j]) == 0:
+                probes[i] = probe_cmd(sol[i])
+        return probes
 
     def execute(self, sol):
         if len(sol) == 0:
             return
-
+        with tracing.span('execute', 'robot'):
+            with tracing.span('compile', 'robot'):
+                plan = self.compile(sol)
+            return self.run(plan)
+
+    # Record that the brick of the `i`-th move was busy with it from `start` to `end` (in ns)
+    def trace_move(self, plan, i, start, end):
+        tracing.complete('move %d' % i, 'robot', start, end, tid='brick %d' % plan.bricks[i])
+
+    # The probe of a move (see `probes()`) is only sent once the next move (on another brick) is on
+    # its way, i.e. while we are waiting for a reply anyway. Its reply is handled by the reader thread
+    # of its brick and always arrives before the one of the next command of that brick.
+    def run(self, plan):
         times = []
-        for i in range(len(sol)):
-            prev = sol[i - 1] if i > 0 else None
-            next = sol[i + 1] if i < len(sol) - 1 else None
-            
-            tick = time.time()
-            if is_axial(sol[i]):
-                self.move1(sol[i], prev, next)
-            else:
-                self.move(sol[i], prev, next)
-            times.append(time.time() - tick)
-        return times # return for data collection purposes 
+        stamps = []
+        dones = [None] * len(plan.cmds)
+
+        def done(i, brick, probe):
+            try:
+                brick.check_reply(probe.result())
+            except Exception:
+                return # only a measurement, the move itself went through
+            dones[i] = time.perf_counter_ns()
+
+        for i, (brick, ops, mem) in enumerate(zip(plan.bricks, plan.cmds, plan.mems)):
+            brick = self.bricks[brick]
+            tick = time.perf_counter_ns()
+            future = brick.send_direct_cmd_future(ops, global_mem=mem)
+            if i > 0 and plan.probes[i - 1] is not None:
+                prev = self.bricks[plan.bricks[i - 1]]
+                probe = prev.send_direct_cmd_future(plan.probes[i - 1], global_mem=1)
+                probe.add_done_callback(lambda probe, i=i - 1, prev=prev: done(i, prev, probe))
+            brick.check_reply(future.result(ev3.REPLY_TIMEOUT))
+            tock = time.perf_counter_ns()
+            times.append((tock - tick) / 1e9)
+            stamps.append([tick, tock])
+            if tracing.ENABLED:
+                self.trace_move(plan, i, tick, tock)
+        # Every probed move has a later command on its brick, hence all probes are in by now
+        return MoveTimes(times, [Stamps(*s, done) for s, done in zip(stamps, dones)])
 
     def solve_pressed(self):
-        return is_pressed(self.bricks[2], 0) # left button
+        return is_pressed(self.bricks[2], SOLVE_BUTTON)
 
     def scramble_pressed(self):
-        return is_pressed(self.bricks[2], 1) # right button
+        return is_pressed(self.bricks[2], SCRAMBLE_BUTTON)
+
+    def watch_buttons(self):
+        return ButtonWatcher(self.bricks[2])
+
+
+SOLVE_BUTTON = 0 # left
+SCRAMBLE_BUTTON = 1 # right
+BUTTON_POLL = 0. # seconds between two button reads; back-to-back by default
+
+# Reads both buttons with a single direct command (every `interval` seconds) on its own thread and
+# publishes every press as (button, time of the reply) so that a press is noticed within about one
+# command round trip (plus the interval). Polling only happens while resumed since the brick is also
+# needed for executing moves, it is thus never competing with a solve.
+# If polling fails, the error is raised by `wait()` (instead of it blocking forever).
+class ButtonWatcher:
+
+    def __init__(self, brick, ports=(SOLVE_BUTTON, SCRAMBLE_BUTTON), interval=BUTTON_POLL):
+        self.brick = brick
+        self.ports = ports
+        self.interval = interval
+        self.cmd = cmd_buttons(ports)
+        self.events = Queue() # `None` wakes up `wait()` once `error` is set
+        self.active = Event()
+        self.lock = Lock() # held while a poll is in flight
+        self.closed = False
+        self.error = None
+
+    def start(self):
+        Thread(target=self.run, daemon=True).start()
+        return self
+
+    def close(self):
+        self.closed = True
+        self.active.set() # wake up the thread so that it can exit
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def run(self):
+        try:
+            self.poll()
+        except Exception as e:
+            self.error = e
+            self.events.put(None)
+
+    def poll(self):
+        state = [False] * len(self.ports)
+        while True:
+            self.active.wait()
+            with self.lock:
+                if self.closed:
+                    return
+                if not self.active.is_set():
+                    continue
+                reply = self.brick.send_direct_cmd(self.cmd, global_mem=len(self.ports))
+                tock = time.time()
+            tmp = buttons(reply, len(self.ports))
+            for i in range(len(self.ports)):
+                if tmp[i] and not state[i]: # only count presses, not holding a button down
+                    self.events.put((self.ports[i], tock))
+            state = tmp
+            if self.interval > 0:
+                time.sleep(self.interval)
+
+    # Start polling; presses from before are dropped
+    def resume(self):
+        while not self.events.empty():
+            self.events.get()
+        self.active.set()
+
+    # Stop polling, returns once the brick is free again
+    def pause(self):
+        self.active.clear()
+        with self.lock:
+            pass
+
+    # Next press as (button, time) or None on timeout
+    def wait(self, timeout=None):
+        try:
+            event = self.events.get(timeout=timeout) if self.error is None else None
+        except Empty:
+            return None
+        if self.error is not None:
+            raise self.error
+        return event
 
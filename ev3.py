@@ -21,6 +21,8 @@ LEGO EV3 direct commands
 
 # pylint: disable=invalid-name, too-many-lines, C0326
 
+import collections
+import concurrent.futures
 import socket
 import struct
 import re
@@ -30,6 +32,8 @@ import datetime
 import math
 import usb.core
 
+import tracing
+
 def LCX(value: int) -> bytes:
     """create a LC0, LC1, LC2, LC4, dependent from the value"""
     if   value >=    -32 and value <      0:
@@ -186,17 +190,145 @@ class SysCmdError(Exception):
     """
     pass
 
+def check_direct_reply(reply: bytes) -> bytes:
+    """
+    Check the status of a direct command reply (raises DirCmdError if it
+    is an error), also for replies not received by an EV3 object
+
+    Returns:
+    the reply itself
+    """
+    if reply[4:5] != _DIRECT_REPLY:
+        raise DirCmdError(
+            "direct command {:02X}:{:02X} replied error".format(
+                reply[2],
+                reply[3]
+            )
+        )
+    return reply
+
+class _ReplyReader(threading.Thread):
+    """
+    background thread, that reads all replies of a single connection
+    and completes the futures waiting for them (keyed by message counter)
+    """
+    def __init__(self, protocol: str, device, sock: socket.socket):
+        super().__init__(daemon=True)
+        self._protocol = protocol
+        self._device = device
+        self._socket = sock
+        self._lock = threading.Lock()
+        self._msg_cnt = 41
+        self._pending = {}
+        self._kept = collections.OrderedDict() # futures of ASYNC commands, see keep
+        self._error = None # set once the reader died, no reply will ever arrive again
+
+    def register(self, reply: bool) -> tuple:
+        """
+        reserve the next message counter of this connection
+
+        Arguments:
+        reply: flag if a reply is expected (then a future is registered for it)
+
+        Returns:
+        message counter (int) and future of the reply (or None)
+
+        Raises the error of the reader if it died (the reply could never arrive)
+        """
+        with self._lock:
+            if self._error is not None:
+                raise self._error
+            if self._msg_cnt < 65535:
+                self._msg_cnt += 1
+            else:
+                self._msg_cnt = 1
+            msg_cnt = self._msg_cnt
+            future = None
+            if reply:
+                future = concurrent.futures.Future()
+                self._pending[struct.pack('<H', msg_cnt)] = future
+        return msg_cnt, future
+
+    def wait(self, counter: bytes, future: concurrent.futures.Future,
+             timeout: float = None) -> bytes:
+        """
+        wait for the reply with the given message counter,
+        its entry is released in any case
+
+        Raises concurrent.futures.TimeoutError if there is no reply within
+        timeout seconds (default REPLY_TIMEOUT) and the error of the reader
+        if it died
+        """
+        try:
+            return future.result(REPLY_TIMEOUT if timeout is None else timeout)
+        finally:
+            self._pending.pop(counter, None)
+
+    def keep(self, counter: bytes, future: concurrent.futures.Future):
+        """
+        keep the future of a reply somebody may later wait for by its
+        counter only (ASYNC mode), at most ASYNC_REPLIES of them
+        """
+        with self._lock:
+            self._kept[counter] = future
+            if len(self._kept) > ASYNC_REPLIES:
+                self._kept.popitem(last=False)
+
+    def take(self, counter: bytes) -> concurrent.futures.Future:
+        """
+        future kept for the given message counter (None if there is none)
+        """
+        with self._lock:
+            return self._kept.pop(counter, None)
+
+    def discard(self, counter: bytes):
+        """
+        release the entry of a reply nobody is going to wait for
+        """
+        self._pending.pop(counter, None)
+
+    def _recv(self) -> bytes:
+        # pylint: disable=no-member
+        if self._protocol in [BLUETOOTH, WIFI]:
+            return self._socket.recv(1024)
+        return bytes(self._device.read(_EP_IN, 1024, 0))
+        # pylint: enable=no-member
+
+    def run(self):
+        try:
+            while True:
+                reply = self._recv()
+                if not reply:
+                    raise ConnectionError('connection to EV3 closed')
+                len_data = struct.unpack('<H', reply[:2])[0] + 2
+                if tracing.ENABLED:
+                    tracing.instant(
+                        'reply', 'usb', tid=tracing.track(self),
+                        counter=struct.unpack('<H', reply[2:4])[0]
+                    )
+                # the entry is released as soon as its reply is there
+                future = self._pending.pop(reply[2:4], None)
+                if future is not None and not future.done():
+                    future.set_result(reply[:len_data])
+        except Exception as exc: # pylint: disable=broad-except
+            # nobody would ever complete the pending futures, later
+            # ones are refused by register
+            with self._lock:
+                self._error = exc
+                pending = list(self._pending.values())
+                self._pending.clear()
+            for future in pending:
+                if not future.done():
+                    future.set_exception(exc)
+
 # pylint: disable=too-many-arguments
 # pylint: disable=too-many-instance-attributes
 class EV3:
     """
     object to communicate with a LEGO EV3 using direct commands
     """
-    _msg_cnt = 41
-    _lock = threading.Lock()
-    _foreign = {}
 
-    def __init__(self, protocol: str=None, host: str=None, ev3_obj=None):
+    def __init__(self, protocol: str=None, host: str=None, ev3_obj=None, device=None):
         """
         Establish a connection to a LEGO EV3 device
 
@@ -204,6 +336,8 @@ class EV3:
         protocol: None, 'Bluetooth', 'Usb' or 'Wifi'
         host: None or mac-address of the LEGO EV3 (f.i. '00:16:53:42:2B:99')
         ev3_obj: None or an existing EV3 object (its connections will be used)
+        device: None or an already opened usb device (f.i. a simulated one),
+                only together with protocol 'Usb'
         """
         assert ev3_obj or protocol, \
             'Either protocol or ev3_obj needs to be given'
@@ -214,7 +348,14 @@ class EV3:
             self._protocol = ev3_obj._protocol
             self._device = ev3_obj._device
             self._socket = ev3_obj._socket
+            self._reader = ev3_obj._reader
             # pylint: enable=protected-access
+        elif device:
+            assert protocol == USB, \
+                'argument device needs protocol ' + USB
+            self._protocol = protocol
+            self._device = device
+            self._socket = None
         else:
             assert protocol in [BLUETOOTH, WIFI, USB], \
                 'Protocol ' + protocol + 'is not valid'
@@ -228,6 +369,10 @@ class EV3:
                 self._connect_wifi(host)
             else:
                 self._connect_usb(host)
+        if not ev3_obj:
+            # every connection demultiplexes its own replies, independent of all others
+            self._reader = _ReplyReader(self._protocol, self._device, self._socket)
+            self._reader.start()
         self._verbosity = 0
         self._sync_mode = STD
 
@@ -246,7 +391,8 @@ class EV3:
         STD:   Use DIRECT_COMMAND_REPLY if global_mem > 0,
                wait for reply if there is one.
         ASYNC: Use DIRECT_COMMAND_REPLY if global_mem > 0,
-               never wait for reply (it's the task of the calling program).
+               never wait for reply (use wait_for_reply or
+               send_direct_cmd_future to receive it).
         SYNC:  Always use DIRECT_COMMAND_REPLY and wait for reply.
 
         The general idea is:
@@ -391,15 +537,66 @@ class EV3:
             cmd_type = _DIRECT_COMMAND_REPLY
         else:
             cmd_type = _DIRECT_COMMAND_NO_REPLY
-        self._lock.acquire()
-        if self._msg_cnt < 65535:
-            self._msg_cnt += 1
-        else:
-            self._msg_cnt = 1
-        msg_cnt = self._msg_cnt
-        self._lock.release()
+        track = cmd_type == _DIRECT_COMMAND_REPLY
+        msg_cnt, future = self._send_direct(ops, local_mem, global_mem, cmd_type, track)
+        counter = struct.pack('<H', msg_cnt)
+        if not track:
+            return counter
+        if self._sync_mode == ASYNC:
+            # only a bounded number of replies is kept for wait_for_reply
+            self._reader.keep(counter, future)
+            return counter
+        return self.check_reply(self._reader.wait(counter, future))
+
+    def wait_for_reply(self, counter: bytes) -> bytes:
+        """
+        Wait for the reply of a direct command sent in sync_mode ASYNC
+
+        Arguments:
+        counter: is the message counter of the corresponding send_direct_cmd
+
+        Returns:
+        reply to the direct command
+
+        Raises ValueError if no reply is kept for counter (f.i. it was
+        already received or more than ASYNC_REPLIES commands were sent since)
+        """
+        future = self._reader.take(counter)
+        if future is None:
+            raise ValueError(
+                "no reply kept for direct command {:02X}:{:02X}".format(
+                    counter[0],
+                    counter[1]
+                )
+            )
+        return self.check_reply(self._reader.wait(counter, future))
+
+    def send_direct_cmd_future(self, ops: bytes,
+                               local_mem: int = 0,
+                               global_mem: int = 0) -> concurrent.futures.Future:
+        """
+        Send a direct command with reply to the LEGO EV3 without waiting for it
+        (independent of sync_mode)
+
+        Arguments:
+        ops: holds netto data only (operations)
+
+        Keyword Arguments:
+        local_mem: size of the local memory
+        global_mem: size of the global memory
+
+        Returns:
+        future, that is completed with the (unchecked) reply as soon as it is
+        received, f.i. for use with asyncio.wrap_future or add_done_callback;
+        pass the reply to check_reply
+        """
+        return self._send_direct(ops, local_mem, global_mem, _DIRECT_COMMAND_REPLY, True)[1]
+
+    def _send_direct(self, ops: bytes, local_mem: int, global_mem: int,
+                     cmd_type: bytes, track: bool) -> tuple:
+        msg_cnt, future = self._reader.register(track)
         cmd = b''.join([
-            struct.pack('<hh', len(ops) + 5, msg_cnt),
+            struct.pack('<hH', len(ops) + 5, msg_cnt),
             cmd_type,
             struct.pack('<h', local_mem * 1024 + global_mem),
             ops
@@ -414,6 +611,18 @@ class EV3:
                   ':'.join('{:02X}'.format(byte) for byte in cmd[5:7]) + '|' + \
                   ':'.join('{:02X}'.format(byte) for byte in cmd[7:]) + '|' \
             )
+        if tracing.ENABLED:
+            tick = tracing.now()
+        try:
+            self._write(cmd)
+        except Exception:
+            self._reader.discard(cmd[2:4])
+            raise
+        if tracing.ENABLED:
+            tracing.complete('write', 'usb', tick, tid=tracing.track(self._reader), counter=msg_cnt)
+        return msg_cnt, future
+
+    def _write(self, cmd: bytes):
         if self._protocol in [BLUETOOTH, WIFI]:
             self._socket.send(cmd)
         elif self._protocol is USB:
@@ -422,71 +631,33 @@ class EV3:
             # pylint: enable=no-member
         else:
             raise RuntimeError('No EV3 connected')
-        counter = cmd[2:4]
-        if  cmd[4:5] == _DIRECT_COMMAND_NO_REPLY or self._sync_mode == ASYNC:
-            return counter
-        else:
-            reply = self.wait_for_reply(counter)
-            return reply
 
-    def wait_for_reply(self, counter: bytes) -> bytes:
+    def check_reply(self, reply: bytes) -> bytes:
         """
-        Ask the LEGO EV3 for a reply and wait until it is received
+        Check the reply to a direct command
 
         Arguments:
-        counter: is the message counter of the corresponding send_direct_cmd
+        reply: as received from the LEGO EV3
 
         Returns:
-        reply to the direct command
+        reply to the direct command (raises DirCmdError if it is an error)
         """
-        self._lock.acquire()
-        reply = self._get_foreign_reply(counter)
-        if reply:
-            self._lock.release()
-            if reply[4:5] != _DIRECT_REPLY:
-                raise DirCmdError(
-                    "direct command {:02X}:{:02X} replied error".format(
-                        reply[2],
-                        reply[3]
-                    )
-                )
-            return reply
-        while True:
-            # pylint: disable=no-member
-            if self._protocol in [BLUETOOTH, WIFI]:
-                reply = self._socket.recv(1024)
-            else:
-                reply = bytes(self._device.read(_EP_IN, 1024, 0))
-            # pylint: enable=no-member
-            len_data = struct.unpack('<H', reply[:2])[0] + 2
-            reply_counter = reply[2:4]
-            if self._verbosity >= 1:
-                now = datetime.datetime.now().strftime('%H:%M:%S.%f')
-                print(now + \
-                      ' Recv 0x|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[0:2]) + \
-                      '|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[2:4]) + \
-                      '|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[4:5]) + \
-                      '|', end='')
-                if len_data > 5:
-                    dat = ':'.join('{:02X}'.format(byte) for byte in reply[5:len_data])
-                    print(dat + '|')
-                else:
-                    print()
-            if counter != reply_counter:
-                self._put_foreign_reply(reply_counter, reply[:len_data])
+        if self._verbosity >= 1:
+            now = datetime.datetime.now().strftime('%H:%M:%S.%f')
+            print(now + \
+                  ' Recv 0x|' + \
+                  ':'.join('{:02X}'.format(byte) for byte in reply[0:2]) + \
+                  '|' + \
+                  ':'.join('{:02X}'.format(byte) for byte in reply[2:4]) + \
+                  '|' + \
+                  ':'.join('{:02X}'.format(byte) for byte in reply[4:5]) + \
+                  '|', end='')
+            if len(reply) > 5:
+                dat = ':'.join('{:02X}'.format(byte) for byte in reply[5:])
+                print(dat + '|')
             else:
-                self._lock.release()
-                if reply[4:5] != _DIRECT_REPLY:
-                    raise DirCmdError(
-                        "direct command {:02X}:{:02X} replied error".format(
-                            reply[2],
-                            reply[3]
-                        )
-                    )
-                return reply[:len_data]
+                print()
+        return check_direct_reply(reply)
 
     def send_system_cmd(self, cmd: bytes, reply: bool=True) -> bytes:
         """
@@ -508,15 +679,9 @@ class EV3:
             cmd_type = _SYSTEM_COMMAND_REPLY
         else:
             cmd_type = _SYSTEM_COMMAND_NO_REPLY
-        self._lock.acquire()
-        if self._msg_cnt < 65535:
-            self._msg_cnt += 1
-        else:
-            self._msg_cnt = 1
-        msg_cnt = self._msg_cnt
-        self._lock.release()
+        msg_cnt, future = self._reader.register(reply)
         cmd = b''.join([
-            struct.pack('<hh', len(cmd) + 3, msg_cnt),
+            struct.pack('<hH', len(cmd) + 3, msg_cnt),
             cmd_type,
             cmd
         ])
@@ -529,96 +694,52 @@ class EV3:
                   ':'.join('{:02X}'.format(byte) for byte in cmd[4:5]) + '|' + \
                   ':'.join('{:02X}'.format(byte) for byte in cmd[5:]) + '|' \
             )
-        # pylint: disable=no-member
-        if self._protocol in [BLUETOOTH, WIFI]:
-            self._socket.send(cmd)
-        elif self._protocol is USB:
-            self._device.write(_EP_OUT, cmd, 100)
-        else:
-            raise RuntimeError('No EV3 connected')
-        # pylint: enable=no-member
+        try:
+            self._write(cmd)
+        except Exception:
+            self._reader.discard(cmd[2:4])
+            raise
         counter = cmd[2:4]
         if not reply:
             return counter
         else:
-            reply = self._wait_for_system_reply(counter)
+            reply = self._wait_for_system_reply(counter, future)
             return reply
 
-    def _wait_for_system_reply(self, counter: bytes) -> bytes:
+    def _wait_for_system_reply(self, counter: bytes, future: concurrent.futures.Future) -> bytes:
         """
         Ask the LEGO EV3 for a system command reply and wait until received
 
         Arguments:
         counter: is the message counter of the corresponding send_system_cmd
+        future: of the reply
 
         Returns:
         reply to the system command
         """
-        self._lock.acquire()
-        reply = self._get_foreign_reply(counter)
-        if reply:
-            self._lock.release()
-            if reply[4:5] != _SYSTEM_REPLY:
-                raise SysCmdError("error: {:02X}".format(reply[6]))
-            return reply
-        if self._protocol == BLUETOOTH:
-            time.sleep(0.1)
-        while True:
-            # pylint: disable=no-member
-            if self._protocol in [BLUETOOTH, WIFI]:
-                reply = self._socket.recv(1024)
-            else:
-                reply = bytes(self._device.read(_EP_IN, 1024, 0))
-            # pylint: enable=no-member
-            len_data = struct.unpack('<H', reply[:2])[0] + 2
-            reply_counter = reply[2:4]
-            if self._verbosity >= 1:
-                now = datetime.datetime.now().strftime('%H:%M:%S.%f')
-                print(now + \
-                      ' Recv 0x|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[0:2]) + \
-                      '|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[2:4]) + \
-                      '|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[4:5]) + \
-                      '|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[5:6]) + \
-                      '|' + \
-                      ':'.join('{:02X}'.format(byte) for byte in reply[6:7]) + \
-                      '|', end='')
-                if len_data > 7:
-                    dat = ':'.join('{:02X}'.format(byte) for byte in reply[7:len_data])
-                    print(dat + '|')
-                else:
-                    print()
-            if counter != reply_counter:
-                self._put_foreign_reply(reply_counter, reply[:len_data])
+        reply = self._reader.wait(counter, future)
+        if self._verbosity >= 1:
+            now = datetime.datetime.now().strftime('%H:%M:%S.%f')
+            print(now + \
+                  ' Recv 0x|' + \
+                  ':'.join('{:02X}'.format(byte) for byte in reply[0:2]) + \
+                  '|' + \
+                  ':'.join('{:02X}'.format(byte) for byte in reply[2:4]) + \
+                  '|' + \
+                  ':'.join('{:02X}'.format(byte) for byte in reply[4:5]) + \
+                  '|' + \
+                  ':'.join('{:02X}'.format(byte) for byte in reply[5:6]) + \
+                  '|' + \
+                  ':'.join('{:02X}'.format(byte) for byte in reply[6:7]) + \
+                  '|', end='')
+            if len(reply) > 7:
+                dat = ':'.join('{:02X}'.format(byte) for byte in reply[7:])
+                print(dat + '|')
             else:
-                self._lock.release()
-                if reply[4:5] != _SYSTEM_REPLY:
-                    raise SysCmdError("system command replied error: {:02X}".format(reply[6]))
-                return reply[:len_data]
-
-    def _put_foreign_reply(self, counter: bytes, reply: bytes) -> None:
-        """
-        put a foreign reply to the stack
-        """
-        if counter in self._foreign:
-            raise ValueError('reply with counter ' + counter + ' already exists')
-        else:
-            self._foreign[counter] = reply
-
-    def _get_foreign_reply(self, counter: bytes) -> bytes:
-        """
-        get a reply from the stack (returns None if there is no)
-        and delete this reply from the stack
-        """
-        if counter in self._foreign:
-            reply = self._foreign[counter]
-            del self._foreign[counter]
-            return reply
-        else:
-            return None
+                print()
+        if reply[4:5] != _SYSTEM_REPLY:
+            raise SysCmdError("system command replied error: {:02X}".format(reply[6]))
+        return reply
 # pylint: enable=too-many-instance-attributes
 
 WIFI      = 'Wifi'
@@ -629,6 +750,9 @@ STD       = 'STD'                     # reply if global_mem, wait for reply
 ASYNC     = 'ASYNC'                   # reply if global_mem, never wait for reply
 SYNC      = 'SYNC'                    # always with reply, always wait for reply
 
+REPLY_TIMEOUT = 10.                   # seconds to wait for a reply
+ASYNC_REPLIES = 256                   # replies of ASYNC commands kept for wait_for_reply
+
 _ID_VENDOR_LEGO = 0x0694              # Usb-Identification of the device
 _ID_PRODUCT_EV3 = 0x0005
 
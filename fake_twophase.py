@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+# Stand-in for the rob-twophase CLI speaking the same protocol as far as `solve.py` uses it, for testing
+# the solver handling without the actual solver. Solutions are random (but deterministic per cube)
+# move sequences and not actually correct; a longer search (-m) returns the shortest of more of them.
+# Crashes or hangs can be injected to test failover.
+# Usage: ./fake_twophase.py [-m MILLIS] [-w N_WARMUPS] [-n N_SOLS] [--crash-after N] [--hang-after N]
+
+import argparse
+import random
+import sys
+import time
+
+
+FACES = 'UDRLFB'
+POWERS = ['', '2', "'"]
+
+def random_sol(rng, n):
+    moves = []
+    axis = -1
+    for _ in range(n):
+        axis = rng.choice([a for a in range(3) if a != axis])
+        faces = [FACES[2 * axis], FACES[2 * axis + 1]]
+        if rng.random() < .3:
+            rng.shuffle(faces)
+            moves.append('(%s%s %s%s)' % (faces[0], rng.choice(POWERS), faces[1], rng.choice(POWERS)))
+        else:
+            moves.append(rng.choice(faces) + rng.choice(POWERS))
+    return ' '.join(moves)
+
+def print_sols(rng, args):
+    sols = [random_sol(rng, rng.randrange(16, 22)) for _ in range(args.n * max(args.m // 5, 1))]
+    for sol in sorted(sols, key=lambda sol: len(sol.split(' ')))[:args.n]:
+        print('%s (%d)' % (sol, len(sol.split(' '))), flush=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', type=int, default=1)
+    parser.add_argument('-s', type=int, default=1)
+    parser.add_argument('-m', type=int, default=10)
+    parser.add_argument('-w', type=int, default=0)
+    parser.add_argument('-c', action='store_true')
+    parser.add_argument('-n', type=int, default=1)
+    parser.add_argument('--warmup-millis', type=float, default=1.)
+    parser.add_argument('--crash-after', type=int, default=-1)
+    parser.add_argument('--hang-after', type=int, default=-1)
+    args = parser.parse_args()
+
+    print('Loading tables ...', flush=True)
+    time.sleep(args.w * args.warmup_millis / 1000)
+    print('Ready!', flush=True)
+
+    n_cmds = 0
+    for line in sys.stdin:
+        if n_cmds == args.crash_after:
+            sys.exit(1)
+        if n_cmds == args.hang_after:
+            while True:
+                time.sleep(1)
+        n_cmds += 1
+
+        cmd = line.split()
+        if cmd[0] == 'solve' and len(cmd) == 2 and len(cmd[1]) == 54:
+            rng = random.Random(cmd[1])
+            time.sleep(args.m / 1000)
+            print('%dms' % args.m, flush=True)
+            print_sols(rng, args)
+        elif cmd[0] == 'solve':
+            print('Face-cube error.', flush=True)
+        elif cmd[0] == 'scramble':
+            rng = random.Random()
+            print(''.join(rng.choice(FACES) for _ in range(54)), flush=True)
+            time.sleep(args.m / 1000)
+            print('%dms' % args.m, flush=True)
+            print_sols(rng, args)
+        else:
+            print('Error.', flush=True)
+        print('Ready!', flush=True)
@@ -1,91 +1,161 @@
 # Main program controlling the robot; not much is happening here, we just call the appropriate
 # tools implemented in the other files.
 
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from datetime import datetime
-import pickle
 import random
 import time
 
-import cv2
-import numpy as np
+START = time.time()
 
-from control import *
+# NOTE: Everything pulling in NumPy, the precomputed tables or `turn.times` (i.e. `control`, `budget`
+# and `solcache`) is only imported by the startup tasks below, so that this happens in parallel too
 from scan.scan import *
 from solve import *
+import tracing
+
+ADAPTIVE = False # per-cube search budget (see `budget.py`) instead of always searching for `MILLIS`
+OBJECTIVE = 'median' # what solution selection minimizes, one of `control.OBJECTIVES`
+TRACE = False # save a timeline of every solve's execution to `traces/` (see `tracing.py`)
 
 
 def save_scan(scanner, facecube):
     scanner.save('scan/data/%s.png' % facecube)
 
 def save_times(sol, times):
-    f = datetime.now().strftime('%y%m%d%H%M%S')
-    pickle.dump((sol, times), open('solves/%s.pkl' % f , 'wb'))
+    solvelog.append(sol, times, time.time())
+    model.update(sol, times)
+    model.save()
+    model.save_times() # picked up by `reload_times()` once we are idle again
+    if ADAPTIVE:
+        solver.solver.save() # gain curve of the `AdaptiveSolver` behind the cache
 
 
 # Select the fastest of the solutions returned by the solver
-def sel_best(sols):
-    sols = [optim_halfdirs(translate(sol)) for sol in sols]
-    times = [expected_time(sol) for sol in sols]
-    best = 0
-    for i in range(1, len(sols)):
-        if times[i] < times[best]:
-            best = i
-    return sols[best]
-
-
-with Solver() as solver:
-    print('Solver initialized.')
-    
-    with Scanner(SCANDIR) as scanner:
-        scanner.start()
-        print('Scanning set up.')
-
-        robot = Robot()
-        print('Connected to robot.')
-
-        print('Ready!') # we don't want to print this again and again while waiting for button presses
-        while True: # polling is the most straight-forward way to check both buttons at once
-            time.sleep(.05) # 50ms should be sufficient for a smooth experience
-            if robot.scramble_pressed():
-                scanner.stop()
-                scramble = sel_best(solver.scramble())
-                start = time.time()
-                print('Executing ...')
-                times = robot.execute(scramble)
-                print('Scrambled! %fs' % (time.time() - start))
-                save_times(scramble, times)
-                scanner.start()
-                continue
-            elif not robot.solve_pressed():
-                continue
-            # Now actually start solving
-
-            scanner.stop() # don't waste any CPU resources fetching further images
-            # NOTE: We start timing only after we have received a frame from the camera and start any processing.
-            # While this might not be 100% conform to the Guiness World Record rules, I am (at least at this point)
-            # not interested in optimizing the camera latency as I do not think this should be an integral part
-            # of a cube-solving robot.
+def sel_best(sols, objective=OBJECTIVE):
+    sols = [translate(sol) for sol in sols]
+    best = rate_batch(encode_batch(sols), objective).argmin()
+    return optim_halfdirs(sols[best], objective)
+
+# Same as `sel_best()` but rating every solution as soon as it arrives from the solver; the final
+# choice is thus ready right when the stream ends (None if there were no solutions)
+def sel_best_stream(sols, objective=OBJECTIVE):
+    best = None
+    best_time = float('inf')
+    for sol in sols:
+        sol = optim_halfdirs(translate(sol), objective)
+        t = expected_time(sol, objective)
+        if t < best_time:
+            best = sol
+            best_time = t
+    return best
+
+
+# The solver warmup, loading the scanner's color table and connecting to the bricks are all
+# independent of each other and thus all run concurrently; every component is registered with `stack`
+# for cleanup as soon as it is up.
+
+def start_solver(stack):
+    from solcache import CachedSolver, SolutionCache
+    if ADAPTIVE:
+        from budget import AdaptiveSolver
+        pool = stack.enter_context(AdaptiveSolver())
+    else:
+        pool = stack.enter_context(SolverPool())
+    cache = stack.enter_context(SolutionCache())
+    return CachedSolver(pool, cache) # repeated (or symmetric) cubes are answered instantly
+
+def start_scanner(stack):
+    scanner = stack.enter_context(Scanner(SCANDIR))
+    scanner.start()
+    return scanner
+
+def start_robot(stack):
+    import control
+    return control.Robot()
+
+def startup(stack):
+    def timed(start, msg):
+        res = start(stack)
+        print('%s %.3fs' % (msg, time.time() - START))
+        return res
+
+    with ThreadPoolExecutor() as executor:
+        futures = [
+            executor.submit(timed, start_solver, 'Solver initialized.'),
+            executor.submit(timed, start_scanner, 'Scanning set up.'),
+            executor.submit(timed, start_robot, 'Connected to robot.')
+        ]
+    return [f.result() for f in futures]
+
+
+with ExitStack() as stack:
+    solver, scanner, robot = startup(stack)
+    from control import * # already loaded
+    import solvelog
+    import timing
+    model = timing.load()
+
+    prefetcher = stack.enter_context(ScramblePrefetcher(solver, sel_best)) # stopped before the solvers
+    prefetcher.resume()
+
+    watcher = stack.enter_context(robot.watch_buttons())
+    watcher.resume()
+
+    print('Ready! %.3fs' % (time.time() - START)) # we don't want to print this again and again while waiting for button presses
+    while True:
+        button, _ = watcher.wait()
+        watcher.pause() # the brick is needed for executing now
+        if button == SCRAMBLE_BUTTON:
+            scanner.stop()
+            scramble = prefetcher.get() # already optimized, also stops refilling
             start = time.time()
-            
-            print('Scanning ...')
-            facecube = scanner.scan()
-            
-            if facecube != '':
-                print('Solving ...')
-                sols = solver.solve(facecube)
-
-                if len(sols) > 0:
-                    sol = sel_best(sols)
-                    print('Executing ...')
-                    times = robot.execute(sol)
-                    print('Solved! %fs' % (time.time() - start))
-                    save_times(sol, times)
-                    save_scan(scanner, facecube)
-                else:
-                    print('Error.')        
+            print('Executing ...')
+            times = robot.execute(scramble)
+            print('Scrambled! %fs' % (time.time() - start))
+            save_times(scramble, times)
+            reload_times()
+            scanner.start()
+            prefetcher.resume()
+            watcher.resume()
+            continue
+        # Now actually start solving
+
+        prefetcher.pause() # the solver should have the CPU all to itself
+        scanner.stop() # don't waste any CPU resources fetching further images
+        # NOTE: We start timing only after we have received a frame from the camera and start any processing.
+        # While this might not be 100% conform to the Guiness World Record rules, I am (at least at this point)
+        # not interested in optimizing the camera latency as I do not think this should be an integral part
+        # of a cube-solving robot.
+        start = time.time()
+        
+        print('Scanning ...')
+        facecube = scanner.scan()
+        
+        if facecube != '':
+            print('Solving ...')
+            sol = sel_best_stream(solver.iter_solve(facecube))
+
+            if sol is not None:
+                print('Executing ...')
+                if TRACE:
+                    tracing.enable()
+                times = robot.execute(sol)
+                print('Solved! %fs' % (time.time() - start))
+                if TRACE:
+                    tracing.disable()
+                    tracing.save('traces/%s.json' % datetime.now().strftime('%y%m%d%H%M%S'))
+                save_times(sol, times)
+                save_scan(scanner, facecube)
             else:
-                print('Error.')
+                print('Error.')        
+        else:
+            print('Error.')
 
-            scanner.start()
-            print('Ready!')
+        reload_times()
+        scanner.start()
+        prefetcher.resume()
+        watcher.resume()
+        print('Ready!')
 
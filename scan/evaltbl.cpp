@@ -0,0 +1,83 @@
+/**
+ * Offline comparison of scan-tables: runs `match_colors()` on saved scans (written by `tbleval.py`, one line
+ * "FACECUBE B G R B G R ..." per scan) with every given table and reports the share of correctly matched cubes
+ * as well as the matching times. Between two scans the cache is flushed, like it would be by the frame processing
+ * in the actual scanner.
+ *
+ * Usage: ./evaltbl SCANS TABLE ...
+ */
+
+#include <algorithm>
+#include <chrono>
+#include <fstream>
+#include <iostream>
+#include <sstream>
+#include <string>
+#include <vector>
+
+#include "match.h"
+
+const int FLUSH_SIZE = 1 << 24; // larger than any cache
+volatile char flush[FLUSH_SIZE];
+
+struct Scan {
+  std::string facecube;
+  int bgrs[N_FACELETS][3];
+};
+
+int main(int argc, char *argv[]) {
+  if (argc < 3) {
+    std::cout << "Usage: ./evaltbl SCANS TABLE ..." << std::endl;
+    return 0;
+  }
+
+  std::vector<Scan> scans;
+  std::ifstream f(argv[1]);
+  std::string l;
+  while (std::getline(f, l)) {
+    std::istringstream line(l);
+    Scan scan;
+    line >> scan.facecube;
+    for (int i = 0; i < N_FACELETS; i++) {
+      for (int j = 0; j < 3; j++)
+        line >> scan.bgrs[i][j];
+    }
+    if (line)
+      scans.push_back(scan);
+  }
+  std::cout << scans.size() << " scans" << std::endl;
+  if (scans.empty())
+    return 0;
+
+  for (int i = 2; i < argc; i++) {
+    if (!init_match(argv[i])) {
+      std::cout << "Invalid `" << argv[i] << "`." << std::endl;
+      continue;
+    }
+
+    int correct = 0;
+    int errors = 0;
+    std::vector<double> times;
+    for (Scan& scan : scans) {
+      for (int j = 0; j < FLUSH_SIZE; j += 64)
+        flush[j]++;
+      auto tick = std::chrono::high_resolution_clock::now();
+      std::string facecube = match_colors(scan.bgrs);
+      times.push_back(std::chrono::duration_cast<std::chrono::nanoseconds>(
+        std::chrono::high_resolution_clock::now() - tick
+      ).count() / 1e6);
+      correct += facecube == scan.facecube;
+      errors += facecube == "";
+    }
+
+    std::sort(times.begin(), times.end());
+    double mean = 0;
+    for (double t : times)
+      mean += t / times.size();
+    std::cout << argv[i] << ": " << correct << "/" << scans.size() << " correct (" << errors << " scan errors), "
+      << "match " << mean << "ms mean, " << times[times.size() / 2] << "ms median, " << times.back() << "ms max"
+      << std::endl;
+  }
+
+  return 0;
+}
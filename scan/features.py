@@ -0,0 +1,89 @@
+# Incremental store of the training data: the extracted BGR values of all facelets together with the
+# labels (from the file name) of every saved scan in `data/`. Only images which are not in the store yet
+# are decoded (in parallel), so retraining is just fitting plus table generation. An image is identified
+# by its name together with its modification time and size, since saving a repeated cube overwrites
+# its image. As the features depend on the scan rectangles, there is one store per version of
+# `scan.rects` (and of the record format).
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import hashlib
+import os
+
+import cv2
+import numpy as np
+
+from train import COL_ORDER, read_scanrects, extract_cols
+
+
+DATADIR = 'data/'
+RECTFILE = 'scan.rects'
+FEATDIR = 'features/'
+N_FACELETS = 54
+VERSION = 2
+
+RECORD = np.dtype([
+    ('name', 'S64'), # file name in `DATADIR`
+    ('mtime', '<i8'), # of the image in ns
+    ('size', '<i8'), # of the image in bytes
+    ('bgrs', 'u1', (N_FACELETS, 3)),
+    ('labels', 'u1', (N_FACELETS,)) # see `COL_ORDER`
+])
+
+def store_path(rectfile=RECTFILE):
+    with open(rectfile, 'rb') as f:
+        return os.path.join(FEATDIR, '%s.v%d.npy' % (hashlib.sha1(f.read()).hexdigest()[:16], VERSION))
+
+# All stored records (read-only)
+def load(path):
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=RECORD)
+    return np.load(path, mmap_mode='r')
+
+def decode(rects, datadir, name):
+    return extract_cols(cv2.imread(os.path.join(datadir, name)), rects)
+
+# Brings the store up to date with the images in `datadir` and returns all records (sorted by name)
+def update(datadir=DATADIR, rectfile=RECTFILE, n_jobs=None):
+    path = store_path(rectfile)
+    store = load(path)
+    names = sorted(f for f in os.listdir(datadir) if f.endswith('.png'))
+    stats = [os.stat(os.path.join(datadir, f)) for f in names]
+    keys = {(f.encode(), st.st_mtime_ns, st.st_size) for f, st in zip(names, stats)}
+    # Records of deleted or overwritten images are dropped, the latter are then decoded again
+    keep = np.array([
+        key in keys for key in zip(store['name'].tolist(), store['mtime'].tolist(), store['size'].tolist())
+    ], dtype=bool)
+    known = set(store['name'][keep].tolist())
+    new = [(f, st) for f, st in zip(names, stats) if f.encode() not in known]
+    if not new and keep.all():
+        return store
+
+    recs = np.zeros(len(new), dtype=RECORD)
+    if new:
+        recs['mtime'] = [st.st_mtime_ns for _, st in new]
+        recs['size'] = [st.st_size for _, st in new]
+        new = [f for f, _ in new]
+        recs['name'] = [f.encode() for f in new]
+        recs['labels'] = [[COL_ORDER[c] for c in f.split('.')[0]] for f in new]
+        with ProcessPoolExecutor(n_jobs) as pool:
+            job = partial(decode, read_scanrects(rectfile), datadir)
+            recs['bgrs'] = list(pool.map(job, new, chunksize=max(len(new) // (4 * os.cpu_count()), 1)))
+
+    recs = np.concatenate([store[keep], recs])
+    recs = recs[np.argsort(recs['name'])]
+    del store
+    os.makedirs(FEATDIR, exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, recs)
+    os.replace(path + '.tmp', path)
+    return load(path)
+
+
+# Usage: python features.py
+if __name__ == '__main__':
+    import time
+
+    tick = time.time()
+    feats = update()
+    print('%d scans in %.2fs.' % (len(feats), time.time() - tick))
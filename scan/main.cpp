@@ -11,8 +11,13 @@ const std::string RECTFILE = "scan.rects";
 const int UID = 2;
 const int DID = 0;
 
-int main() {
-  init_match();
+// Usage: ./scan [TABLE] (`scan.tbl` by default, may also be a compact table)
+int main(int argc, char *argv[]) {
+  std::string tblfile = argc > 1 ? argv[1] : TBLFILE;
+  if (!init_match(tblfile)) {
+    std::cout << "Invalid `" << tblfile << "`." << std::endl;
+    return 1;
+  }
   std::vector<std::vector<cv::Rect>> rects(N_FACELETS);
 
   std::ifstream f(RECTFILE);
@@ -30,7 +35,7 @@ int main() {
   for (std::vector<cv::Rect>& rs : rects) {
     if (rs.empty()) {
       std::cout << "Invalid `scan.rects`." << std::endl;
-      return 0;
+      return 1;
     }
   }
 
@@ -16,6 +16,10 @@
 #include <string>
 #include <tuple>
 #include <vector>
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
 
 
 /* Since scanner and solver should be independent programs, we need to redefine several important constants here. */
@@ -98,7 +102,63 @@ using colset_t = uint8_t;
 
 // Lookup the precomputed confidence values learned by KNN for every possible BGR-color
 const int N_BGRS = 16777216;
-uint16_t (*scantbl)[color::COUNT];
+const uint16_t (*scantbl)[color::COUNT];
+
+// Header of the table file, see `scantbl.py`
+const char TBL_MAGIC[] = "SQTBL";
+const int TBL_VERSION = 1;
+const int TBL_HEADER = 12; // magic (5 bytes), version (1), number of colors (2), number of BGR-colors (4)
+
+// Compact alternative: `uint8_t` confidences on a grid of `2^bits + 1` points per channel, looked up at the nearest
+// point or trilinearly interpolated (small enough to stay in cache)
+const uint8_t (*ctbl)[color::COUNT];
+int cbits;
+bool cinterp;
+
+const char CTBL_MAGIC[] = "SQCTB";
+const int CTBL_VERSION = 1;
+const int CTBL_HEADER = 10; // magic (5 bytes), version (1), bits per channel (1), interpolate (1), number of colors (2)
+
+// Currently mapped table file
+void *tblmap = NULL;
+size_t tblsize;
+
+void lookup_conf(const int bgr[3], int conf[color::COUNT]) {
+  if (ctbl == NULL) {
+    for (int col = 0; col < color::COUNT; col++)
+      conf[col] = scantbl[256 * (256 * bgr[0] + bgr[1]) + bgr[2]][col];
+    return;
+  }
+
+  int n = (1 << cbits) + 1;
+  int shift = 8 - cbits;
+  if (!cinterp) {
+    int i = 0;
+    for (int c = 0; c < 3; c++)
+      i = n * i + ((bgr[c] + ((1 << shift) >> 1)) >> shift);
+    for (int col = 0; col < color::COUNT; col++)
+      conf[col] = ctbl[i][col];
+    return;
+  }
+
+  // Integer weights, i.e. all confidences are scaled by `2^(3 * shift)` (which does not change any order)
+  int step = 1 << shift;
+  std::fill(conf, conf + color::COUNT, 0);
+  for (int corner = 0; corner < 8; corner++) {
+    int w = 1;
+    int i = 0;
+    for (int c = 0; c < 3; c++) {
+      int bit = (corner >> (2 - c)) & 1;
+      int f = bgr[c] & (step - 1);
+      w *= bit ? f : step - f;
+      i = n * i + (bgr[c] >> shift) + bit;
+    }
+    if (w == 0) // also makes sure we never go beyond the last grid point
+      continue;
+    for (int col = 0; col < color::COUNT; col++)
+      conf[col] += w * ctbl[i][col];
+  }
+}
 
 template <int n_cubies, int n_oris, const int cubiecols[n_cubies][n_oris]>
 class Options {
@@ -428,10 +488,8 @@ std::string match_colors(const int bgrs[N_FACELETS][3], int n_attempts) {
   int facecube[N_FACELETS];
 
   int conf[N_FACELETS][color::COUNT];
-  for (int f = 0; f < N_FACELETS; f++) {
-    for (int col = 0; col < color::COUNT; col++)
-      conf[f][col] = scantbl[256 * (256 * bgrs[f][0] + bgrs[f][1]) + bgrs[f][2]][col];
-  }
+  for (int f = 0; f < N_FACELETS; f++)
+    lookup_conf(bgrs[f], conf[f]);
 
   std::priority_queue<std::tuple<int, int, int>> heap;
   for (int f = 0; f < N_FACELETS; f++) {
@@ -510,22 +568,80 @@ std::string match_colors(const int bgrs[N_FACELETS][3], int n_attempts) {
   return std::string(s, N_FACELETS);
 }
 
-bool init_match() {
-  FILE *f = fopen(TBLFILE.c_str(), "rb");
-  if (f == NULL)
+// The table is mapped read-only rather than read, which makes startup instant and lets all processes using
+// the table share its pages. Besides the full and compact formats, a legacy full table without any header is
+// accepted too (deployed tables predate the header).
+bool init_match(const std::string& file) {
+  int fd = open(file.c_str(), O_RDONLY);
+  if (fd < 0)
+    return false;
+  struct stat st;
+  if (fstat(fd, &st) < 0 || st.st_size < TBL_HEADER) {
+    close(fd);
+    return false;
+  }
+  size_t size = st.st_size;
+  void *tbl = mmap(NULL, size, PROT_READ, MAP_SHARED, fd, 0);
+  close(fd); // the mapping stays valid
+  if (tbl == MAP_FAILED)
     return false;
-  scantbl = new uint16_t[N_BGRS][color::COUNT];
-  bool succ = fread(scantbl, sizeof(uint16_t[N_BGRS][color::COUNT]), 1, f) == 1;
-  fclose(f);
-  return succ;
+
+  const char *header = (const char*) tbl;
+  bool valid = false;
+  if (memcmp(header, TBL_MAGIC, 5) == 0) {
+    uint16_t n_cols;
+    uint32_t n_bgrs;
+    memcpy(&n_cols, header + 6, sizeof(n_cols));
+    memcpy(&n_bgrs, header + 8, sizeof(n_bgrs));
+    valid = header[5] == TBL_VERSION && n_cols == color::COUNT && n_bgrs == N_BGRS &&
+      size == TBL_HEADER + sizeof(uint16_t[N_BGRS][color::COUNT]);
+    if (valid) {
+      scantbl = (const uint16_t (*)[color::COUNT]) (header + TBL_HEADER);
+      ctbl = NULL;
+    }
+  } else if (memcmp(header, CTBL_MAGIC, 5) == 0) {
+    int bits = header[6];
+    uint16_t n_cols;
+    memcpy(&n_cols, header + 8, sizeof(n_cols));
+    size_t n = (1 << bits) + 1;
+    valid = header[5] == CTBL_VERSION && 1 <= bits && bits <= 8 && n_cols == color::COUNT &&
+      size == CTBL_HEADER + n * n * n * color::COUNT;
+    if (valid) {
+      ctbl = (const uint8_t (*)[color::COUNT]) (header + CTBL_HEADER);
+      cbits = bits;
+      cinterp = header[7] != 0;
+    }
+  } else if (size == sizeof(uint16_t[N_BGRS][color::COUNT])) {
+    // Legacy table without header as written by older versions of `train.py` (`python scantbl.py convert` adds it)
+    std::cout << "Warning: `" << file << "` has no header, assuming a legacy table." << std::endl;
+    valid = true;
+    scantbl = (const uint16_t (*)[color::COUNT]) header;
+    ctbl = NULL;
+  }
+  if (!valid) {
+    munmap(tbl, size);
+    return false;
+  }
+  // Start paging in the table in the background so that the first scan does not have to wait for the disk
+  madvise(tbl, size, MADV_WILLNEED);
+
+  if (tblmap != NULL) // switching tables
+    munmap(tblmap, tblsize);
+  tblmap = tbl;
+  tblsize = size;
+  return true;
 }
 
 /*
 int main() {
+  auto tick = std::chrono::high_resolution_clock::now();
   if (!init_match()) {
     std::cout << "Error loading table." << std::endl;
     return 0;
   }
+  std::cout << std::chrono::duration_cast<std::chrono::microseconds>(
+    std::chrono::high_resolution_clock::now() - tick
+  ).count() / 1000. << "ms (load)" << std::endl;
 
   int bgrs[][3] = {
     { 96, 149,  75},
@@ -584,7 +700,7 @@ int main() {
     {100, 100, 115}
   };
 
-  auto tick = std::chrono::high_resolution_clock::now();
+  tick = std::chrono::high_resolution_clock::now();
   std::cout << match_colors(bgrs) << std::endl;
   std::cout << std::chrono::duration_cast<std::chrono::microseconds>(
     std::chrono::high_resolution_clock::now() - tick
@@ -11,7 +11,8 @@ const std::string TBLFILE = "scan.tbl";
 
 const int N_FACELETS = 54;
 
-bool init_match();
+// Loads either a full or a compact table (see `scantbl.py`), can be called again to switch tables
+bool init_match(const std::string& file = TBLFILE);
 // `n_attempts` is the maximum number of color options we explore per facelet; 3 is probably optimal here
 std::string match_colors(const int bgrs[N_FACELETS][3], int n_attempts = 3);
 
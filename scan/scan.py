@@ -3,17 +3,28 @@ from subprocess import Popen, PIPE
 
 SCANDIR = 'scan'
 
+class ScannerError(Exception):
+    pass
+
 class Scanner:
 
-    def __init__(self, cwd):
+    # `table` is the scan-table file to use (`scan.tbl` if not given), see `scantbl.py`
+    def __init__(self, cwd, table=None):
         self.cwd = cwd
+        self.table = table
     
     def connect(self):
         self.proc = Popen(
-            ['./scan'], stdin=PIPE, stdout=PIPE, cwd=self.cwd
+            ['./scan'] + ([self.table] if self.table else []), stdin=PIPE, stdout=PIPE, cwd=self.cwd
         )
-        while 'Ready!' not in self.proc.stdout.readline().decode():
-            pass # wait for everything to boot up
+        # Wait for everything to boot up; the scanner exits right away on errors (e.g. an invalid table)
+        line = ''
+        while 'Ready!' not in line:
+            out = self.proc.stdout.readline().decode()
+            if out == '':
+                self.proc.wait()
+                raise ScannerError('scanner exited during startup: %s' % (line.strip() or 'no output'))
+            line = out
         return self
 
     def disconnect(self):
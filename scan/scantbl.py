@@ -0,0 +1,154 @@
+# The scan-table (confidence of every cube color for all 16.7 million BGR values, ~200MB) is stored
+# behind a small header so that it can simply be memory-mapped read-only, both by the scanner and by
+# any Python tools, instead of being read completely by every process. Only the pages that are
+# actually looked up are ever loaded and the OS shares them between all processes.
+# Alternatively, the confidences can be stored as a compact table: `uint8` values on a coarse grid of
+# `2^bits + 1` points per channel (spaced `2^(8 - bits)` apart, the last one standing for 255), which
+# are looked up at the nearest grid point or trilinearly interpolated. With 5 bits this is ~210KB and
+# thus stays in the L2 cache, the KNN being smooth enough in color space.
+
+import os
+import struct
+
+import numpy as np
+
+
+TBLFILE = 'scan.tbl'
+N_BGRS = 256 ** 3
+N_COLORS = 6
+DTYPE = np.dtype('<u2')
+
+# Must match `init_match()` in `match.cpp`
+MAGIC = b'SQTBL'
+VERSION = 1
+HEADER = struct.Struct('<5sBHI') # magic, version, number of colors, number of BGR values
+
+CTBLFILE = 'scan.ctbl'
+CMAGIC = b'SQCTB'
+CVERSION = 1
+CHEADER = struct.Struct('<5sBBBH') # magic, version, bits per channel, interpolate, number of colors
+
+# Row of the table for each of the given BGR values
+def index(bgrs):
+    bgrs = np.asarray(bgrs, dtype=np.int64)
+    return 256 * (256 * bgrs[..., 0] + bgrs[..., 1]) + bgrs[..., 2]
+
+def save(table, path=TBLFILE):
+    table = np.ascontiguousarray(table, dtype=DTYPE)
+    if table.shape != (N_BGRS, N_COLORS):
+        raise ValueError('scan-table must have shape %s' % ((N_BGRS, N_COLORS),))
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, N_COLORS, N_BGRS))
+        table.tofile(f)
+    os.replace(path + '.tmp', path) # never leave a half-written table for the scanner
+
+# Writes a header and an all-zero table to be filled (possibly by several processes) via `open_rw()`
+def create(path=TBLFILE):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, N_COLORS, N_BGRS))
+        f.truncate(HEADER.size + N_BGRS * N_COLORS * DTYPE.itemsize)
+
+def open_rw(path):
+    return np.memmap(path, dtype=DTYPE, mode='r+', offset=HEADER.size, shape=(N_BGRS, N_COLORS))
+
+# Whether `path` is a table written by an older `train.py` (raw array without any header)
+def is_legacy(path):
+    return os.path.getsize(path) == N_BGRS * N_COLORS * DTYPE.itemsize
+
+# The table as a read-only `np.memmap` of shape (N_BGRS, N_COLORS); like `match.cpp`, this also accepts
+# a legacy table
+def load(path=TBLFILE):
+    if is_legacy(path):
+        return np.memmap(path, dtype=DTYPE, mode='r', shape=(N_BGRS, N_COLORS))
+    with open(path, 'rb') as f:
+        magic, version, n_cols, n_bgrs = HEADER.unpack(f.read(HEADER.size))
+    size = HEADER.size + N_BGRS * N_COLORS * DTYPE.itemsize
+    if magic != MAGIC or version != VERSION or (n_cols, n_bgrs) != (N_COLORS, N_BGRS) or \
+            os.path.getsize(path) != size:
+        raise ValueError('%s is not a compatible scan-table' % path)
+    return np.memmap(path, dtype=DTYPE, mode='r', offset=HEADER.size, shape=(N_BGRS, N_COLORS))
+
+# Adds the header to a legacy table
+def convert(path=TBLFILE):
+    if not is_legacy(path):
+        raise ValueError('%s is not a headerless scan-table' % path)
+    save(np.memmap(path, dtype=DTYPE, mode='r', shape=(N_BGRS, N_COLORS)), path)
+
+# BGR values of all points of a compact table grid (in table order)
+def grid(bits):
+    vals = np.minimum(np.arange(2 ** bits + 1) << (8 - bits), 255)
+    return np.stack(np.meshgrid(vals, vals, vals, indexing='ij'), -1).reshape(-1, 3)
+
+def save_compact(table, bits, interp=True, path=CTBLFILE):
+    n = 2 ** bits + 1
+    table = np.ascontiguousarray(table, dtype=np.uint8)
+    if table.shape != (n ** 3, N_COLORS):
+        raise ValueError('compact scan-table must have shape %s' % ((n ** 3, N_COLORS),))
+    with open(path + '.tmp', 'wb') as f:
+        f.write(CHEADER.pack(CMAGIC, CVERSION, bits, interp, N_COLORS))
+        table.tofile(f)
+    os.replace(path + '.tmp', path)
+
+# Returns (table of shape (n, n, n, N_COLORS), bits, interp)
+def load_compact(path=CTBLFILE):
+    with open(path, 'rb') as f:
+        magic, version, bits, interp, n_cols = CHEADER.unpack(f.read(CHEADER.size))
+    n = 2 ** bits + 1
+    if magic != CMAGIC or version != CVERSION or n_cols != N_COLORS or not 1 <= bits <= 8 or \
+            os.path.getsize(path) != CHEADER.size + n ** 3 * N_COLORS:
+        raise ValueError('%s is not a compatible compact scan-table' % path)
+    table = np.memmap(path, dtype=np.uint8, mode='r', offset=CHEADER.size, shape=(n, n, n, N_COLORS))
+    return table, bits, bool(interp)
+
+# Confidences for the given BGR values exactly as computed by `match.cpp` (integers, interpolated ones
+# scaled by `2^(3 * (8 - bits))`)
+def lookup_compact(table, bits, interp, bgrs):
+    bgrs = np.asarray(bgrs, dtype=np.int64)
+    shift = 8 - bits
+    if not interp:
+        k = (bgrs + ((1 << shift) >> 1)) >> shift
+        return table[k[..., 0], k[..., 1], k[..., 2]].astype(np.int64)
+    k = bgrs >> shift
+    f = bgrs & ((1 << shift) - 1)
+    conf = 0
+    for corner in range(8):
+        bits1 = [(corner >> (2 - c)) & 1 for c in range(3)]
+        w = 1
+        for c, bit in enumerate(bits1):
+            w = w * (f[..., c] if bit else (1 << shift) - f[..., c])
+        k1 = np.minimum(k + bits1, 2 ** bits) # weight is 0 whenever this clips
+        conf = conf + w[..., None] * table[k1[..., 0], k1[..., 1], k1[..., 2]]
+    return conf
+
+
+# Startup benchmark: time until the table is usable and for the lookups of a first scan, reading the
+# whole table (as the scanner used to) vs. memory-mapping it; run once more after dropping the page
+# cache (`echo 1 > /proc/sys/vm/drop_caches`) for cold numbers.
+# Usage: python scantbl.py [bench | convert] [scan.tbl]
+if __name__ == '__main__':
+    import sys
+    import time
+
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'bench'
+    path = sys.argv[2] if len(sys.argv) > 2 else TBLFILE
+
+    if cmd == 'convert':
+        convert(path)
+        print('Converted %s.' % path)
+    else:
+        bgrs = index(np.random.randint(0, 256, (54, 3)))
+
+        def read():
+            with open(path, 'rb') as f:
+                f.seek(0 if is_legacy(path) else HEADER.size)
+                return np.fromfile(f, dtype=DTYPE).reshape(N_BGRS, N_COLORS)
+
+        for name, open_tbl in [('read', read), ('mmap', lambda: load(path))]:
+            tick = time.time()
+            table = open_tbl()
+            tock = time.time()
+            table[bgrs].sum()
+            print('%s: startup %8.2fms, first scan %.3fms' % (
+                name, 1000 * (tock - tick), 1000 * (time.time() - tock)
+            ))
+            del table
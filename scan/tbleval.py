@@ -0,0 +1,60 @@
+# Compares scan-tables (full and compact ones, see `scantbl.py`) on the saved scans in `data/`: accuracy
+# of the most confident color per facelet, agreement with the first table and lookup time here, then
+# the accuracy and time of the full `match_colors()` via `evaltbl` (if it was built).
+# Usage: python tbleval.py [TABLE ...] (`scan.tbl scan.ctbl` by default)
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import features
+import scantbl
+
+
+# Function mapping an array of BGR values to their confidences
+def open_table(path):
+    with open(path, 'rb') as f:
+        magic = f.read(len(scantbl.MAGIC))
+    if magic == scantbl.MAGIC or scantbl.is_legacy(path):
+        table = scantbl.load(path)
+        return lambda bgrs: table[scantbl.index(bgrs)]
+    table, bits, interp = scantbl.load_compact(path)
+    return lambda bgrs: scantbl.lookup_compact(table, bits, interp, bgrs)
+
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or [scantbl.TBLFILE, scantbl.CTBLFILE]
+
+    data = features.update()
+    facecubes = [name.decode().split('.')[0] for name in data['name']]
+    scans = np.array(data['bgrs'])
+    labels = np.array(data['labels'])
+    noncenter = np.arange(54) % 9 != 4 # centers are fixed anyways
+    print('%d scans' % len(scans))
+
+    first = None
+    for path in paths:
+        lookup = open_table(path)
+        times = []
+        for bgrs in scans:
+            tick = time.time()
+            lookup(bgrs)
+            times.append(time.time() - tick)
+        pred = lookup(scans).argmax(-1)[:, noncenter]
+        if first is None:
+            first = pred
+        print('%s: %.2fKB, facelet accuracy %.4f, agreement %.4f, lookup %.3fms' % (
+            path, os.path.getsize(path) / 1024, np.mean(pred == labels[:, noncenter]),
+            np.mean(pred == first), 1000 * np.median(times)
+        ))
+
+    if os.path.exists('evaltbl'):
+        with tempfile.NamedTemporaryFile('w', suffix='.txt') as f:
+            for facecube, bgrs in zip(facecubes, scans):
+                f.write(facecube + ' ' + ' '.join(str(v) for v in bgrs.ravel()) + '\n')
+            f.flush()
+            subprocess.run(['./evaltbl', f.name] + paths)
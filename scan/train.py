@@ -1,14 +1,20 @@
 # Trains a KNN for assigning confidence scores to observed colors. For increased inference speed the model is 
-# persisted in form of a full lookup table for all 16.7 million different BGR values.
+# persisted in form of a full lookup table for all 16.7 million different BGR values (or alternatively as a
+# compact table on a coarse color grid, see `scantbl.py`).
 
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
 import os
 import pickle
-from collections import namedtuple
+import time
 
 import cv2
 import numpy as np
 from sklearn.neighbors import KNeighborsClassifier
 
+import scantbl
+
 
 COL_ORDER = {
     'U': 0, 'R': 1, 'F': 2, 'D': 3, 'L': 4, 'B': 5
@@ -26,75 +32,139 @@ def read_scanrects(filename):
                 rects[-1].append(Rect(*[int(n) for n in splits[i:(i + 4)]]))
         return rects 
 
-def extract_cols(image, rects):
-    scans = np.zeros((len(rects), image.shape[2]))
-    for i, r in enumerate(rects):
+# Flat layout of the rectangles in an image of the given (height, width): indices of all their pixels,
+# start and size of every rectangle in there as well as start and number of rectangles of every facelet
+# which has any. Rectangles which are empty (after clipping to the image) are dropped, facelets without
+# any pixels get color 0. This is compiled only once per layout (and changes automatically whenever
+# `rects` is edited).
+Layout = namedtuple('Layout', ['pixels', 'starts', 'areas', 'facelets', 'counts', 'nonempty'])
+
+@lru_cache(maxsize=16)
+def compile_rects(rects, shape):
+    pixels, areas, facelets, counts = [], [], [], []
+    for r in rects:
+        start = len(areas)
         for x, y, width, height in r:
-            tmp = image[y:(y + height), x:(x + width)]
-            scans[i] += np.mean(tmp, axis=(0, 1))
-        scans[i] /= len(rects[i])
+            ys = np.arange(max(y, 0), min(y + height, shape[0]))
+            xs = np.arange(max(x, 0), min(x + width, shape[1]))
+            if ys.size > 0 and xs.size > 0:
+                pixels.append((shape[1] * ys[:, None] + xs).ravel())
+                areas.append(pixels[-1].size)
+        facelets.append(start)
+        counts.append(len(areas) - start)
+    counts = np.array(counts)
+    nonempty = counts > 0
+    return Layout(
+        np.concatenate(pixels) if pixels else np.zeros(0, dtype=int), np.cumsum([0] + areas[:-1]),
+        np.array(areas), np.array(facelets)[nonempty], counts[nonempty], nonempty
+    )
+
+# Mean color of every facelet (mean over its rectangles of their mean colors) for a single image or a
+# stacked batch of images (all with the same shape) at once
+def extract_cols(images, rects):
+    layout = compile_rects(tuple(tuple(r) for r in rects), images.shape[-3:-1])
+    flat = images.reshape(images.shape[:-3] + (-1, images.shape[-1]))
+    scans = np.zeros(images.shape[:-3] + (len(rects), images.shape[-1]))
+    if layout.nonempty.any():
+        sums = np.add.reduceat(flat[..., layout.pixels, :], layout.starts, axis=-2, dtype=np.int64)
+        means = sums / layout.areas[:, None]
+        facelets = np.add.reduceat(means, layout.facelets, axis=-2) / layout.counts[:, None]
+        scans[..., layout.nonempty, :] = facelets
     # Input has inaccuracies anyways + this is what makes a full conf-table possible
     return scans.astype(np.uint8)
 
-
+# Red, orange, yellow, green, blue, red
+HUES = np.array([0, 30, 60, 120, 240, 360]) / 360
+
+# Transform hue space so that the distance between all cube colors is roughly the same
+def transform(hsvs):
+    sector = np.zeros(hsvs.shape[0], dtype=int)
+    for i in range(1, 6):
+        sector[(HUES[i - 1] <= hsvs[:, 0]) & (hsvs[:, 0] < HUES[i])] = i
+    thue = .2 * ((sector - 1) + (hsvs[:, 0] - HUES[sector - 1]) / (HUES[sector] - HUES[sector - 1]))
+    return np.column_stack([
+        hsvs[:, 1] * np.cos(2 * np.pi * thue),
+        hsvs[:, 1] * np.sin(2 * np.pi * thue),
+        hsvs[:, 2]
+    ])
+
+# Convert to HSV and transform space
+def preprocess(X):
+    X = X.astype(np.uint8)
+    X = cv2.cvtColor(np.expand_dims(X, 0), cv2.COLOR_BGR2HSV)[0]
+    X = X.astype(float)
+    X[:, 0] /= 180
+    X[:, 1:] /= 255
+    return transform(X)
+
+# The full table is generated in blocks of all colors with the same blue value; these are predicted in
+# parallel by a pool of worker processes, each writing its blocks directly into the (memory-mapped)
+# output file. A block is predicted in chunks of `CHUNK` colors since the neighbor search needs memory
+# proportional to the number of queries times `n_neighbors` (~600MB for a whole block), and the pool is
+# capped at `MAX_WORKERS` processes, so that the total memory use stays bounded on any machine. The
+# (much smaller) compact tables are predicted the same chunked way.
+N_BLOCKS = 256
+CHUNK = 4096
+MAX_WORKERS = 8
+
+def block_cols(b):
+    g = np.repeat(np.arange(256), 256)
+    r = np.tile(np.arange(256), 256)
+    return np.column_stack([np.full(256 * 256, b), g, r])
+
+def init_worker(model, path):
+    global worker_model, worker_table
+    worker_model = model
+    worker_model.n_jobs = 1 # the pool already uses all cores
+    worker_table = scantbl.open_rw(path)
+
+# Writes `round(scale * model.predict_proba(X))` into `out`, predicting only `chunk` rows at a time
+def predict_chunked(model, X, out, scale, chunk=CHUNK):
+    for i in range(0, len(X), chunk):
+        out[i:(i + chunk)] = np.round(scale * model.predict_proba(X[i:(i + chunk)]))
+    return out
+
+def predict_block(b, chunk=CHUNK):
+    tick = time.time()
+    out = worker_table[(256 * 256 * b):(256 * 256 * (b + 1))]
+    predict_chunked(worker_model, preprocess(block_cols(b)), out, worker_model.n_neighbors, chunk) # integer
+    return b, time.time() - tick
+
+def build_table(model, path=scantbl.TBLFILE, n_jobs=None):
+    if n_jobs is None:
+        n_jobs = min(os.cpu_count(), MAX_WORKERS)
+    tick = time.time()
+    scantbl.create(path + '.tmp')
+    with ProcessPoolExecutor(n_jobs, initializer=init_worker, initargs=(model, path + '.tmp')) as pool:
+        futures = [pool.submit(predict_block, b) for b in range(N_BLOCKS)]
+        for i, future in enumerate(as_completed(futures)):
+            b, t = future.result()
+            print('%3d/%d: block %3d in %.2fs (%.1fs total)' % (i + 1, N_BLOCKS, b, t, time.time() - tick))
+    os.replace(path + '.tmp', path) # never leave a half-written table for the scanner
+
+# Usage: python train.py [BITS [nearest]] (BITS per channel for a compact table, interpolated by default)
 if __name__ == '__main__': # we use some of the above functions in `setup.py`
-    rects = read_scanrects('scan.rects')
+    import sys
+
+    import features
 
-    data = []
-    for f in os.listdir('data/'):
-        labels = [c for c in f.split('.')[0]]
-        img = cv2.imread('data/' + f)
-        data.append((labels, extract_cols(img, rects)))
+    data = features.update()
     print('Data loaded. (%d)' % len(data))
 
-    # Red, orange, yellow, green, blue, red
-    HUES = np.array([0, 30, 60, 120, 240, 360]) / 360
-
-    # Transform hue space so that the distance between all cube colors is roughly the same
-    def transform(hsvs):
-        sector = np.zeros(hsvs.shape[0], dtype=np.int)
-        for i in range(1, 6):
-            sector[(HUES[i - 1] <= hsvs[:, 0]) & (hsvs[:, 0] < HUES[i])] = i
-        thue = .2 * ((sector - 1) + (hsvs[:, 0] - HUES[sector - 1]) / (HUES[sector] - HUES[sector - 1]))
-        return np.column_stack([
-            hsvs[:, 1] * np.cos(2 * np.pi * thue),
-            hsvs[:, 1] * np.sin(2 * np.pi * thue),
-            hsvs[:, 2]
-        ])
-
-    # Convert to HSV and transform space
-    def preprocess(X):
-        X = X.astype(np.uint8)
-        X = cv2.cvtColor(np.expand_dims(X, 0), cv2.COLOR_BGR2HSV)[0]
-        X = X.astype(np.float)
-        X[:, 0] /= 180
-        X[:, 1:] /= 255
-        return transform(X)
-
-    y1 = np.concatenate([d[0] for d in data], axis=0)
-    y = np.zeros(y1.size, dtype=np.int)
-    for col, id in COL_ORDER.items():
-        y[y1 == col] = id
-
-    X = np.concatenate([d[1] for d in data], axis=0)
+    X = data['bgrs'].reshape(-1, 3)
+    y = data['labels'].ravel().astype(int)
     X = preprocess(X)
     model = KNeighborsClassifier(n_neighbors=int(.1 * X.shape[0]), n_jobs=-1)
     model.fit(X, y)
     print('Model learned.')
 
-    b = np.concatenate([np.full(256 * 256, i) for i in range(256)])
-    g = np.tile(np.concatenate([np.full(256, i) for i in range(256)]), 256)
-    r = np.tile(np.arange(256), 256 * 256)
-    allcols = np.column_stack([b, g, r])
-    allcols = preprocess(allcols)
-
-    print('Generating table ...')
-    table = []
-    for i, batch in enumerate(np.split(allcols, 256)):
-        print(i)
-        table.append(model.predict_proba(batch) * model.n_neighbors) # will always be integer
-    table = np.concatenate(table, axis=0)
-    table = table.astype(np.uint16)
-    table.tofile('scan.tbl')
+    if len(sys.argv) > 1:
+        bits = int(sys.argv[1])
+        interp = len(sys.argv) < 3 or sys.argv[2] != 'nearest'
+        X = preprocess(scantbl.grid(bits))
+        table = predict_chunked(model, X, np.empty((len(X), scantbl.N_COLORS), dtype=np.uint8), 255)
+        scantbl.save_compact(table, bits, interp)
+    else:
+        print('Generating table ...')
+        build_table(model)
     print('Done.')
-
@@ -0,0 +1,209 @@
+# Simulated EV3 hardware so that the host side of the robot can be tested and benchmarked
+# on any machine without the actual bricks.
+
+import asyncio
+import heapq
+import struct
+import threading
+import time
+
+import ev3
+
+
+USB_LATENCY = .001 # a full USB round trip takes about 1ms
+
+# Reply an EV3 would send for `cmd` (None if no reply was requested); the global memory is all zero
+def reply(cmd):
+    counter = cmd[2:4]
+    cmd_type = cmd[4:5]
+    if cmd_type == ev3._DIRECT_COMMAND_REPLY:
+        global_mem = struct.unpack('<h', cmd[5:7])[0] % 1024
+        return struct.pack('<h', 3 + global_mem) + counter + ev3._DIRECT_REPLY + bytes(global_mem)
+    if cmd_type == ev3._SYSTEM_COMMAND_REPLY:
+        return struct.pack('<h', 5) + counter + ev3._SYSTEM_REPLY + cmd[5:6] + ev3.SYSTEM_REPLY_OK
+    return None
+
+# Stand-in for a `usb.core.Device` of an EV3 which simply replies to every direct command after
+# a fixed latency; it does not interpret the commands in any way.
+class FakeDevice:
+
+    def __init__(self, latency=USB_LATENCY):
+        self.latency = latency
+        self.replies = [] # heap of (due time, reply)
+        self.cond = threading.Condition()
+
+    def write(self, ep, data, timeout):
+        rep = reply(bytes(data))
+        if rep is not None:
+            self.push(time.perf_counter() + self.latency, rep)
+        return len(data)
+
+    def push(self, due, rep):
+        with self.cond:
+            heapq.heappush(self.replies, (due, rep))
+            self.cond.notify()
+
+    def read(self, ep, size, timeout):
+        with self.cond:
+            while True:
+                if self.replies:
+                    due, reply = self.replies[0]
+                    delay = due - time.perf_counter()
+                    if delay <= 0:
+                        heapq.heappop(self.replies)
+                        return reply[:size]
+                    self.cond.wait(delay)
+                else:
+                    self.cond.wait()
+
+def connect(device):
+    return ev3.EV3(protocol=ev3.USB, device=device)
+
+
+MOTOR_SPEED = 1000. # degrees per second of a motor running at full power
+MOTOR_DELAY = .002 # seconds until a motor actually starts moving
+OP_TIME = .0001 # seconds the brick needs to execute a single operation
+MAX_OPS = 100000 # guard against commands which would never terminate
+
+PORTS = [ev3.PORT_A, ev3.PORT_B, ev3.PORT_C, ev3.PORT_D]
+
+# Decode the parameter at `pc` of a direct command: (is global variable, constant value or variable
+# index) and the position of the next one; local variables are not supported (we never use them)
+def param(ops, pc):
+    b = ops[pc]
+    if b & 0x80 == 0: # short format
+        if b & 0x40 == 0:
+            return (False, b - 64 if b & 0x20 else b & 0x3F), pc + 1
+        value, pc1 = b & 0x1F, pc + 1
+    else:
+        size = {1: 1, 2: 2, 3: 4}[b & 0x07]
+        value = int.from_bytes(ops[(pc + 1):(pc + 1 + size)], 'little', signed=b & 0x40 == 0)
+        pc1 = pc + 1 + size
+        if b & 0x40 == 0:
+            return (False, value), pc1
+    if b & 0x20 == 0:
+        raise ValueError('local variables are not supported')
+    return (True, value), pc1
+
+N_PARAMS = {
+    ev3.opNop: 0,
+    ev3.opOutput_Step_Power: 7, # layer, ports, power, ramp up, constant, ramp down, brake
+    ev3.opOutput_Ready: 2, # layer, ports
+    ev3.opInput_Device: 4, # GET_RAW, layer, port, destination
+    ev3.opInput_Read: 5, # layer, port, type, mode, destination
+    ev3.opAdd32: 3, # a, b, destination
+    ev3.opJr_Lt32: 3, # a, b, offset
+    ev3.opJr_Gt32: 3
+}
+
+# A motor rotates at constant speed from `pos0` (reached at time `t0`) to `target`
+class Motor:
+
+    def __init__(self):
+        self.t0 = 0.
+        self.pos0 = 0
+        self.target = 0
+
+    def pos(self, t):
+        dist = self.target - self.pos0
+        moved = min(max(t - self.t0, 0) * MOTOR_SPEED, abs(dist))
+        return self.pos0 + int(moved if dist > 0 else -moved)
+
+    def done(self):
+        return self.t0 + abs(self.target - self.pos0) / MOTOR_SPEED
+
+    def step(self, t, deg):
+        self.pos0 = self.pos(t)
+        self.t0 = t + MOTOR_DELAY
+        self.target = self.pos0 + deg
+
+# Stand-in for the `usb.core.Device` of an EV3 which actually executes the direct commands the robot
+# emits, with motors moving over time and (touch sensor) buttons which can be set via `buttons`.
+# Like the real brick, commands are processed strictly one after another, each taking `OP_TIME` per
+# operation; since everything is deterministic, a command is simulated completely upon arrival and
+# its reply is then delivered at the corresponding time.
+class Brick(FakeDevice):
+
+    def __init__(self, latency=USB_LATENCY):
+        super().__init__(latency)
+        self.motors = {port: Motor() for port in PORTS}
+        self.buttons = [0] * 4
+        self.free = 0. # time at which the brick is done with all queued commands
+
+    def tacho(self, port, t=None):
+        return self.motors[port].pos(time.perf_counter() if t is None else t)
+
+    def write(self, ep, data, timeout):
+        cmd = bytes(data)
+        if cmd[4:5] not in [ev3._DIRECT_COMMAND_REPLY, ev3._DIRECT_COMMAND_NO_REPLY]:
+            return super().write(ep, data, timeout)
+        mem = bytearray(struct.unpack('<h', cmd[5:7])[0] % 1024)
+        with self.cond:
+            start = max(time.perf_counter() + self.latency / 2, self.free)
+            self.free = self.execute(cmd[7:], mem, start)
+            if cmd[4:5] == ev3._DIRECT_COMMAND_REPLY:
+                rep = struct.pack('<h', 3 + len(mem)) + cmd[2:4] + ev3._DIRECT_REPLY + bytes(mem)
+                self.push(self.free + self.latency / 2, rep)
+        return len(data)
+
+    # Run the operations `ops` on global memory `mem` starting at time `t`; returns the end time
+    def execute(self, ops, mem, t):
+        def get(p):
+            var, value = p
+            return struct.unpack_from('<i', mem, value)[0] if var else value
+
+        pc = 0
+        for _ in range(MAX_OPS):
+            if pc >= len(ops):
+                return t
+            op = ops[pc:(pc + 1)]
+            if op not in N_PARAMS:
+                raise ValueError('unsupported operation {:02X}'.format(op[0]))
+            args = []
+            pc += 1
+            for _ in range(N_PARAMS[op]):
+                p, pc = param(ops, pc)
+                args.append(p)
+            t += OP_TIME
+
+            if op == ev3.opOutput_Step_Power:
+                ports, power = get(args[1]), get(args[2])
+                deg = sum(get(a) for a in args[3:6])
+                for port in PORTS:
+                    if ports & port:
+                        self.motors[port].step(t, deg if power > 0 else -deg)
+            elif op == ev3.opOutput_Ready:
+                ports = get(args[1])
+                t = max([t] + [self.motors[port].done() for port in PORTS if ports & port])
+            elif op == ev3.opInput_Device:
+                if get(args[0]) != ev3.GET_RAW[0]:
+                    raise ValueError('unsupported opInput_Device subcode')
+                struct.pack_into('<i', mem, args[3][1], self.tacho(PORTS[get(args[2]) - 16], t))
+            elif op == ev3.opInput_Read:
+                struct.pack_into('<b', mem, args[4][1], self.buttons[get(args[1])])
+            elif op == ev3.opAdd32:
+                struct.pack_into('<i', mem, args[2][1], get(args[0]) + get(args[1]))
+            elif op == ev3.opJr_Lt32 and get(args[0]) < get(args[1]):
+                pc += get(args[2])
+            elif op == ev3.opJr_Gt32 and get(args[0]) > get(args[1]):
+                pc += get(args[2])
+        raise ValueError('command does not terminate')
+
+def sim_bricks(n=3, latency=USB_LATENCY):
+    return [connect(Brick(latency)) for _ in range(n)]
+
+# Local stream socket stand-in for a brick (at Unix socket `path`), replying after `latency`
+async def serve(path, latency=USB_LATENCY):
+    loop = asyncio.get_running_loop()
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                size = await reader.readexactly(2)
+                rep = reply(size + await reader.readexactly(struct.unpack('<h', size)[0]))
+                if rep is not None:
+                    loop.call_later(latency, writer.write, rep)
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    return await asyncio.start_unix_server(handle, path)
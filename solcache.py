@@ -0,0 +1,213 @@
+# Persistent cache of solver results in front of `Solver.solve()`. Cubes are stored in a canonical form
+# under the 48 cube symmetries (so all symmetric states share a single entry) and the stored solutions
+# are mapped back to the actual cube's orientation on lookup.
+
+from itertools import permutations, product
+import mmap
+import os
+import struct
+
+import numpy as np
+
+
+FACES = 'URFDLB' # order of the faces in a facecube string
+
+# Outward normals of the faces as (x, y, z) with x pointing right, y up and z to the front
+NORMALS = {
+    'U': (0, 1, 0), 'R': (1, 0, 0), 'F': (0, 0, 1), 'D': (0, -1, 0), 'L': (-1, 0, 0), 'B': (0, 0, -1)
+}
+
+# Position (center of the corresponding cubie) of the facelet in row `r` and column `c` of a face
+def facelet_pos(face, r, c):
+    return {
+        'U': (c - 1, 1, r - 1),
+        'R': (1, 1 - r, 1 - c),
+        'F': (c - 1, 1 - r, 1),
+        'D': (c - 1, -1, 1 - r),
+        'L': (-1, 1 - r, c - 1),
+        'B': (1 - c, 1 - r, -1)
+    }[face]
+
+FACELETS = [(facelet_pos(f, i // 3, i % 3), NORMALS[f]) for f in FACES for i in range(9)]
+FACELET_INDEX = {f: i for i, f in enumerate(FACELETS)}
+FACE_OF_NORMAL = {n: f for f, n in NORMALS.items()}
+
+def apply(mat, v):
+    return tuple(sum(mat[i][j] * v[j] for j in range(3)) for i in range(3))
+
+def det(mat):
+    return (
+        mat[0][0] * (mat[1][1] * mat[2][2] - mat[1][2] * mat[2][1]) -
+        mat[0][1] * (mat[1][0] * mat[2][2] - mat[1][2] * mat[2][0]) +
+        mat[0][2] * (mat[1][0] * mat[2][1] - mat[1][1] * mat[2][0])
+    )
+
+# A cube symmetry as facelet permutation + relabeling of the faces (= colors and moves)
+class Symmetry:
+
+    def __init__(self, mat):
+        self.mirror = det(mat) < 0
+        self.faces = {f: FACE_OF_NORMAL[apply(mat, n)] for f, n in NORMALS.items()}
+        self.perm = [0] * len(FACELETS) # symmetric cube has facelet `i` at `perm[i]`
+        for i, (pos, normal) in enumerate(FACELETS):
+            self.perm[FACELET_INDEX[(apply(mat, pos), apply(mat, normal))]] = i
+        self.colors = str.maketrans(self.faces)
+        # Mapping of all move tokens (also as part of an axial move); mirroring inverts all directions
+        powers = {'': "'", '2': '2', "'": ''} if self.mirror else {'': '', '2': '2', "'": "'"}
+        self.moves = {}
+        for f in FACES:
+            for p in powers:
+                m = self.faces[f] + powers[p]
+                self.moves.update({f + p: m, '(' + f + p: '(' + m, f + p + ')': m + ')'})
+
+    def cube(self, facecube):
+        return ''.join([facecube[i] for i in self.perm]).translate(self.colors)
+
+    # Map solution of a cube to the corresponding solution of the symmetric cube
+    def sol(self, sol):
+        if sol == '':
+            return sol
+        return ' '.join([self.moves[m] for m in sol.split(' ')])
+
+# All 48 symmetries (signed permutation matrices), identity first
+SYMS = [
+    Symmetry([[signs[i] * (perm[i] == j) for j in range(3)] for i in range(3)])
+    for perm in permutations(range(3)) for signs in product([1, -1], repeat=3)
+]
+SYMS.sort(key=lambda s: s.perm != list(range(len(FACELETS))) or s.mirror)
+INV = [
+    next(j for j, s1 in enumerate(SYMS) if [s.perm[i] for i in s1.perm] == list(range(len(FACELETS))))
+    for s in SYMS
+]
+
+# Same as `Symmetry.cube()` for all symmetries at once: facelet permutations and color translation
+# tables as arrays
+PERMS = np.array([s.perm for s in SYMS])
+COLORS = np.tile(np.arange(256, dtype=np.uint8), (len(SYMS), 1))
+for i, s in enumerate(SYMS):
+    for f1, f2 in s.faces.items():
+        COLORS[i, ord(f1)] = ord(f2)
+
+# Returns the canonical (lexicographically smallest) representative of `facecube` and the index of
+# the symmetry mapping to it
+def canonicalize(facecube):
+    cube = np.frombuffer(facecube.encode(), dtype=np.uint8)
+    cubes = COLORS[np.arange(len(SYMS))[:, None], cube[PERMS]]
+    cubes = np.ascontiguousarray(cubes).view('S%d' % len(FACELETS)).ravel()
+    sym = int(cubes.argmin())
+    return cubes[sym].decode(), sym
+
+
+CACHEFILE = 'solves.cache'
+N_SLOTS = 4096
+SLOT_SIZE = 1024
+
+MAGIC = b'SQCACHE'
+VERSION = 1
+HEADER = struct.Struct('<7sBIIQ') # magic, version, number of slots, slot size, LRU clock
+SLOT = struct.Struct('<54sQH') # canonical facecube, last use, length of the data which follows
+
+# On-disk hash table with a fixed number of fixed-size slots, memory-mapped for fast access. When full,
+# the least recently used entry is evicted.
+class SolutionCache:
+
+    def __init__(self, path=CACHEFILE, n_slots=N_SLOTS):
+        size = HEADER.size + n_slots * SLOT_SIZE
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, n_slots, SLOT_SIZE, 0))
+                f.truncate(size)
+        self.file = open(path, 'r+b')
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+        magic, version, self.n_slots, slot_size, self.clock = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != VERSION or slot_size != SLOT_SIZE:
+            raise ValueError('%s is not a compatible solution cache' % path)
+
+        self.index = {}
+        self.stamps = [0] * self.n_slots
+        for i in range(self.n_slots):
+            key, self.stamps[i], _ = SLOT.unpack_from(self.map, self.offset(i))
+            if key[0] != 0:
+                self.index[key.decode()] = i
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def offset(self, slot):
+        return HEADER.size + slot * SLOT_SIZE
+
+    def touch(self, slot, key, size):
+        self.clock += 1
+        self.stamps[slot] = self.clock
+        SLOT.pack_into(self.map, self.offset(slot), key.encode(), self.clock, size)
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.n_slots, SLOT_SIZE, self.clock)
+
+    def get(self, facecube):
+        key, sym = canonicalize(facecube)
+        slot = self.index.get(key)
+        if slot is None:
+            return None
+        off = self.offset(slot) + SLOT.size
+        size = SLOT.unpack_from(self.map, self.offset(slot))[2]
+        self.touch(slot, key, size)
+        data = self.map[off:(off + size)].decode()
+        return [SYMS[INV[sym]].sol(sol) for sol in data.split('\n')] if data else []
+
+    def put(self, facecube, sols):
+        key, sym = canonicalize(facecube)
+        data = b''
+        for sol in sols: # store as many solutions as fit
+            tmp = data + (b'\n' if data else b'') + SYMS[sym].sol(sol).encode()
+            if len(tmp) > SLOT_SIZE - SLOT.size:
+                break
+            data = tmp
+
+        slot = self.index.get(key)
+        if slot is None:
+            if len(self.index) < self.n_slots:
+                slot = self.stamps.index(0) # first free slot
+            else:
+                slot = self.stamps.index(min(self.stamps))
+                old = SLOT.unpack_from(self.map, self.offset(slot))[0]
+                del self.index[old.decode()]
+            self.index[key] = slot
+        off = self.offset(slot) + SLOT.size
+        self.map[off:(off + len(data))] = data
+        self.touch(slot, key, len(data))
+
+# Drop-in replacement for a `Solver` (or `SolverPool`) answering repeated (or symmetric) cubes from
+# the cache; results the solver marks as incomplete (`complete`, e.g. after a failover) are not cached
+class CachedSolver:
+
+    def __init__(self, solver, cache):
+        self.solver = solver
+        self.cache = cache
+
+    def solve(self, facecube):
+        if facecube == '':
+            return None
+        return list(self.iter_solve(facecube))
+
+    def iter_solve(self, facecube):
+        sols = self.cache.get(facecube) if facecube != '' else None
+        if sols is not None:
+            yield from sols
+            return
+        sols = []
+        for sol in self.solver.iter_solve(facecube):
+            sols.append(sol)
+            yield sol
+        if sols and getattr(self.solver, 'complete', True):
+            self.cache.put(facecube, sols)
+
+    def scramble(self):
+        return self.solver.scramble()
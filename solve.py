@@ -1,6 +1,10 @@
 # This file handles computing actual solutions by interfacing with the C++ solver.
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty
 from subprocess import Popen, PIPE
+from threading import Condition, Event, Thread
 import time
 
 N_THREADS = 12
@@ -8,6 +12,7 @@ N_SPLITS = 2
 MILLIS = 25
 N_WARMUPS = 100
 N_SOLS = 5
+PREFETCH = 2 # optimized scrambles kept ready
 
 FACEID = {
     'U': 0, 'D': 1, 'R': 2, 'L': 3, 'F': 4, 'B': 5
@@ -40,24 +45,110 @@ def translate(s):
 
     return sol
 
+def solver_cmd(millis=MILLIS):
+    return [
+        './twophase', 
+        '-t', str(N_THREADS), '-s', str(N_SPLITS), '-m', str(millis), '-w', str(N_WARMUPS), '-c', '-n', str(N_SOLS)
+    ]
+
+# A solver not answering within a small multiple of its search budget (plus some slack for scheduling
+# and output) is considered dead, so that a standby can take over while the solve is still worth it
+TIMEOUT_FACTOR = 4
+TIMEOUT_SLACK = .1 # seconds
+WARMUP_TIMEOUT = 60. # seconds, loading the tables (or even generating them on the first run) is slow
+HEALTH_INTERVAL = 1. # seconds between health checks of standby solvers
+PING_TIMEOUT = 1. # an idle solver has to answer a ping within this many seconds
+PING_CUBE = 'ping' # not a valid cube, hence rejected right away
+
+class SolverError(Exception):
+    pass
+
+def solve_timeout(millis=MILLIS):
+    return TIMEOUT_FACTOR * millis / 1000 + TIMEOUT_SLACK
+
+# Search budget (in milliseconds) of a solver command line
+def cmd_millis(cmd):
+    return int(cmd[cmd.index('-m') + 1]) if '-m' in cmd else MILLIS
+
 # Simple Python interface to the rob-twophase CLI
 class Solver:
 
+    # `timeout` is derived from the search budget of `cmd` if not given
+    def __init__(self, cmd=None, timeout=None, warmup_timeout=WARMUP_TIMEOUT):
+        self.cmd = cmd if cmd is not None else solver_cmd()
+        self.timeout = timeout if timeout is not None else solve_timeout(cmd_millis(self.cmd))
+        self.warmup_timeout = warmup_timeout
+
     def connect(self):
-        self.proc = Popen(
-            [
-                './twophase', 
-                '-t', str(N_THREADS), '-s', str(N_SPLITS), '-m', str(MILLIS), '-w', str(N_WARMUPS), '-c', '-n', str(N_SOLS)
-            ], 
-            stdin=PIPE, stdout=PIPE
-        )
-        while 'Ready!' not in self.proc.stdout.readline().decode():
-            pass # wait for everything to boot up
+        self.proc = Popen(self.cmd, stdin=PIPE, stdout=PIPE)
+        # Read output in the background so that we never block on a hanging solver
+        self.lines = Queue()
+        self.stale = False # set once a reply timed out, the output is out of sync from then on
+        Thread(target=self.read_lines, daemon=True).start()
+        try:
+            while 'Ready!' not in self.readline(timeout=self.warmup_timeout):
+                pass # wait for everything to boot up
+        except SolverError:
+            self.kill() # never leak a half-started process
+            raise
         return self
 
+    def read_lines(self):
+        for line in self.proc.stdout:
+            self.lines.put(line.decode())
+        self.lines.put(None) # process died
+
+    def readline(self, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        if self.stale:
+            raise SolverError('solver died')
+        try:
+            line = self.lines.get(timeout=timeout)
+        except Empty:
+            # Its late output would otherwise be read as the reply to the next command
+            self.stale = True
+            self.kill()
+            raise SolverError('solver not responding')
+        if line is None:
+            self.lines.put(None) # keep reporting this
+            raise SolverError('solver died')
+        return line
+
+    def write(self, cmd):
+        try:
+            self.proc.stdin.write(cmd.encode())
+            self.proc.stdin.flush() # command needs to be received instantly
+        except (BrokenPipeError, ValueError):
+            raise SolverError('solver died')
+
+    def alive(self):
+        return self.proc.poll() is None
+
+    # Round trip through the command loop of an idle solver, raises `SolverError` if it does not answer
+    # within `timeout` (a hanging process is still alive after all)
+    def ping(self, timeout=PING_TIMEOUT):
+        self.write('solve %s\n' % PING_CUBE)
+        while 'Ready!' not in self.readline(timeout=timeout):
+            pass
+
+    def healthy(self):
+        if not self.alive():
+            return False
+        try:
+            self.ping()
+        except SolverError:
+            return False
+        return True
+
     def disconnect(self):
         self.proc.terminate()
 
+    # Unlike `disconnect()` this also ends a hanging (or stopped) process
+    def kill(self):
+        self.proc.kill()
+        self.proc.wait()
+
     def __enter__(self):
         return self.connect()
 
@@ -67,40 +158,253 @@ class Solver:
     def solve(self, facecube):
         if facecube == '':
             return None
-        self.proc.stdin.write(('solve %s\n' % facecube).encode())
-        self.proc.stdin.flush() # command needs to be received instantly
+        return list(self.iter_solve(facecube)) # we return multiple solutions
+
+    # Same as `solve()` but yields every solution as soon as the solver outputs it, so that they can
+    # already be processed while the remaining ones are still coming in. NOTE: The generator must
+    # always be consumed completely, otherwise the next command would read left-over output.
+    def iter_solve(self, facecube):
+        if facecube == '':
+            return
+        self.write('solve %s\n' % facecube)
         
-        tmp = self.proc.stdout.readline().decode() # either time taken or an error
+        tmp = self.readline() # either time taken or an error
         if 'error' in tmp:
-            self.proc.stdout.readline() # also need to clear "Ready!" here
-            return []
+            self.readline() # also need to clear "Ready!" here
+            return
         
-        sols = [] # we return multiple solutions
         while True:
-            sol = self.proc.stdout.readline().decode()
+            sol = self.readline()
             if 'Ready!' in sol:
                 break
-            sol = ' '.join(sol.split(' ')[:-1]) # delete appended solution length
-            sols.append(sol) 
-        return sols
+            yield ' '.join(sol.split(' ')[:-1]) # delete appended solution length
 
     def scramble(self):
-        self.proc.stdin.write('scramble\n'.encode())
-        self.proc.stdin.flush()
+        self.write('scramble\n')
 
         # Scrambling will never fail
-        self.proc.stdout.readline() # facecube
-        self.proc.stdout.readline() # time taken
+        self.readline() # facecube
+        self.readline() # time taken
 
         scrambles = []
         while True:
-            scramble = self.proc.stdout.readline().decode()
+            scramble = self.readline()
             if 'Ready!' in scramble:
                 break        
             scramble = ' '.join(scramble.split(' ')[:-1])
             scrambles.append(scramble)
         return scrambles
 
+# Several warmed up solver processes: one is active, `n_standby` are ready to immediately take over if
+# it crashes or hangs and a separate one handles all scrambles (so they never contend with a solve).
+# Dead or hanging standby processes are detected by regular health checks (pings) and replaced in the
+# background.
+class SolverPool:
+
+    def __init__(self, n_standby=1, cmd=None, timeout=None):
+        self.n_standby = n_standby
+        self.cmd = cmd
+        self.timeout = timeout
+        self.lock = Condition()
+        self.checking = None # standby solver currently being pinged
+        self.spawning = 0
+        self.closed = Event()
+        self.complete = True # whether the last solve returned all solutions
+
+    def spawn(self):
+        return Solver(self.cmd, self.timeout).connect()
+
+    def connect(self):
+        with ThreadPoolExecutor() as pool: # all warmups in parallel
+            solvers = list(pool.map(lambda _: self.spawn(), range(self.n_standby + 2)))
+        self.active = solvers[0]
+        self.scrambler = solvers[1]
+        self.standby = solvers[2:]
+        Thread(target=self.monitor, daemon=True).start()
+        return self
+
+    def disconnect(self):
+        self.closed.set()
+        with self.lock:
+            for solver in [self.active, self.scrambler] + self.standby:
+                solver.disconnect()
+            self.standby = []
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.disconnect()
+
+    def add_standby(self):
+        try:
+            solver = self.spawn()
+        except (SolverError, OSError):
+            solver = None
+        with self.lock:
+            self.spawning -= 1
+            if solver is None:
+                return
+            if self.closed.is_set():
+                solver.disconnect()
+            else:
+                self.standby.append(solver)
+
+    # Drop dead standby solvers and start warming up replacements for all missing ones
+    def refill(self):
+        with self.lock:
+            self.lock.wait_for(lambda: self.checking is None)
+            for solver in self.standby:
+                if not solver.alive():
+                    solver.disconnect()
+            self.standby = [solver for solver in self.standby if solver.alive()]
+            missing = max(self.n_standby - len(self.standby) - self.spawning, 0)
+            self.spawning += missing
+        for _ in range(missing):
+            Thread(target=self.add_standby, daemon=True).start()
+
+    # Ping all standby solvers one by one (a solver being pinged is never handed out)
+    def check(self):
+        with self.lock:
+            standby = list(self.standby)
+        for solver in standby:
+            with self.lock:
+                if solver not in self.standby:
+                    continue
+                self.checking = solver
+            healthy = solver.healthy()
+            with self.lock:
+                self.checking = None
+                if not healthy:
+                    solver.kill()
+                    self.standby.remove(solver)
+                self.lock.notify_all()
+
+    def monitor(self):
+        while not self.closed.wait(HEALTH_INTERVAL):
+            self.check()
+            self.refill()
+
+    # Replace the active solver by the next healthy standby one (cold start if there is none)
+    def failover(self):
+        self.active.disconnect()
+        self.refill() # also drops dead ones
+        with self.lock:
+            self.lock.wait_for(lambda: self.checking is None) # at most one ping
+            active = self.standby.pop(0) if self.standby else None
+        self.refill()
+        self.active = active if active is not None else self.spawn()
+
+    def solve(self, facecube):
+        if facecube == '':
+            return None
+        return list(self.iter_solve(facecube))
+
+    # In case the solver fails before emitting any solution we simply retry on the next one; if it
+    # fails afterwards we still return what we got so far, but `complete` is False then
+    def iter_solve(self, facecube):
+        self.complete = True
+        if not self.active.alive():
+            self.failover()
+        n_sols = 0
+        try:
+            for sol in self.active.iter_solve(facecube):
+                n_sols += 1
+                yield sol
+        except SolverError:
+            self.failover()
+            if n_sols > 0:
+                self.complete = False
+                return
+            yield from self.active.iter_solve(facecube)
+
+    def scramble(self):
+        try:
+            return self.scrambler.scramble()
+        except SolverError:
+            self.scrambler.disconnect()
+            self.scrambler = self.spawn()
+            return self.scrambler.scramble()
+
+# Keeps a few scrambles generated and selected (via `select`) ahead of time, so that a scramble request
+# can be executed right away. New ones are only generated while resumed, i.e. while the robot is idle,
+# so that this never competes with an actual solve for the CPU.
+class ScramblePrefetcher:
+
+    def __init__(self, solver, select, n=PREFETCH):
+        self.solver = solver
+        self.select = select
+        self.n = n
+        self.scrambles = deque()
+        self.cond = Condition()
+        self.idle = False
+        self.busy = False
+        self.closed = False
+        self.error = None # unexpected exception which ended prefetching, raised by `get()`
+
+    def start(self):
+        Thread(target=self.run, daemon=True).start()
+        return self
+
+    # Stop prefetching; like `pause()` this waits for a scramble which is currently being generated so
+    # that the solver is never used anymore once this returns (and can thus be disconnected)
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+            self.cond.wait_for(lambda: not self.busy)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        self.close()
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.closed or (self.idle and len(self.scrambles) < self.n))
+                if self.closed:
+                    return
+                self.busy = True
+            scramble = None
+            try:
+                scramble = self.select(self.solver.scramble())
+            except SolverError:
+                pass # simply try again
+            except Exception as e:
+                self.error = e
+            finally: # never leave `pause()` waiting
+                with self.cond:
+                    self.busy = False
+                    if scramble is not None:
+                        self.scrambles.append(scramble)
+                    self.cond.notify_all()
+            if self.error is not None:
+                return
+
+    def resume(self):
+        with self.cond:
+            self.idle = True
+            self.cond.notify_all()
+
+    # Stop refilling; waits for a scramble which is currently being generated (at most one search)
+    def pause(self):
+        with self.cond:
+            self.idle = False
+            self.cond.wait_for(lambda: not self.busy)
+
+    # Next prefetched scramble or a freshly generated one if there is none left; pauses refilling and
+    # raises the error that ended prefetching (if any)
+    def get(self):
+        self.pause()
+        with self.cond:
+            if self.error is not None:
+                raise self.error
+            if self.scrambles:
+                return self.scrambles.popleft()
+        return self.select(self.solver.scramble())
+
 
 if __name__ == '__main__':
     from control import *
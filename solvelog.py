@@ -0,0 +1,236 @@
+# Append-only log of all executed moves (one fixed-size record per move) replacing the individual
+# pickles in `solves/`; it is memory-mapped as a NumPy structured array so that aggregating the
+# timings is a single vectorized scan.
+
+from datetime import datetime
+import os
+import pickle
+import struct
+
+import numpy as np
+
+from control import *
+
+
+LOGFILE = 'solves.log'
+SOLVEDIR = 'solves/' # old format: one pickle per solve, named by the time of the solve
+
+MAGIC = b'SQLOG'
+VERSION = 2
+HEADER = struct.Struct('<5sBH') # magic, version, record size
+
+# Per move timestamps (see `control.Stamps`) are stored relative to the first command of the solve;
+# they are NaN if unknown (motors done is only measured for some moves, older logs have none at all)
+RECORD = np.dtype([
+    ('solve', '<u4'), # number of the solve
+    ('stamp', '<f8'), # time of the solve (seconds since the epoch)
+    ('index', '<u2'), # position of the move in the solution
+    ('move', '<u1'), # move in the dense encoding of `MOVES`
+    ('cls', '<i1'), # cut class of the transition to the next move, -1 for the last move
+    ('half', '?'),
+    ('axial', '?'),
+    ('duration', '<f8'), # seconds
+    ('send', '<f8'), # seconds, command sent
+    ('ack', '<f8'), # reply received, i.e. waitdeg reached
+    ('done', '<f8') # motors done
+])
+RECORD_V1 = np.dtype(RECORD.descr[:-3]) # without any timestamps
+STAMPS = ['send', 'ack', 'done']
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        return HEADER.unpack(f.read(HEADER.size))
+
+# Records of a version 1 log converted to the current version (in memory)
+def upgrade(path):
+    n = (os.path.getsize(path) - HEADER.size) // RECORD_V1.itemsize
+    old = np.fromfile(path, dtype=RECORD_V1, count=n, offset=HEADER.size)
+    recs = np.zeros(n, dtype=RECORD)
+    for name in RECORD_V1.names:
+        recs[name] = old[name]
+    for name in STAMPS:
+        recs[name] = np.nan
+    return recs
+
+# All records (read-only, empty if there is no log yet)
+def load(path=LOGFILE):
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=RECORD)
+    magic, version, size = read_header(path)
+    if magic == MAGIC and (version, size) == (1, RECORD_V1.itemsize):
+        return upgrade(path)
+    if magic != MAGIC or version != VERSION or size != RECORD.itemsize:
+        raise ValueError('%s is not a compatible solve log' % path)
+    n = (os.path.getsize(path) - HEADER.size) // RECORD.itemsize # ignore a partially written record
+    if n == 0:
+        return np.zeros(0, dtype=RECORD)
+    return np.memmap(path, dtype=RECORD, mode='r', offset=HEADER.size, shape=(n,))
+
+# Solves of the old `solves/*.pkl` files as (solution, move times, time of the solve), oldest first
+def read_pickles(solvedir=SOLVEDIR):
+    if not os.path.isdir(solvedir):
+        return []
+    solves = []
+    for f in sorted(os.listdir(solvedir)):
+        if f.endswith('.pkl'):
+            sol, times = pickle.load(open(os.path.join(solvedir, f), 'rb'))
+            solves.append((sol, times, datetime.strptime(f[:-4], '%y%m%d%H%M%S').timestamp()))
+    return solves
+
+# All records or, as long as the log is still empty, those of the old pickles (in memory only)
+def history(path=LOGFILE, solvedir=SOLVEDIR):
+    log = load(path)
+    if len(log) > 0:
+        return log
+    solves = [(sol, times, stamp) for sol, times, stamp in read_pickles(solvedir) if len(sol) > 0]
+    if not solves:
+        return log
+    return np.concatenate([records(sol, times, i, stamp) for i, (sol, times, stamp) in enumerate(solves)])
+
+def records(sol, times, solve, stamp):
+    rec = np.zeros(len(sol), dtype=RECORD)
+    rec['solve'] = solve
+    rec['stamp'] = stamp
+    rec['index'] = np.arange(len(sol))
+    rec['move'] = encode(sol)
+    rec['cls'] = [cut(sol[i], sol[i + 1]) for i in range(len(sol) - 1)] + [-1]
+    rec['half'] = HALF[rec['move']]
+    rec['axial'] = AXIAL[rec['move']]
+    rec['duration'] = times
+    stamps = getattr(times, 'stamps', None) # only `control.MoveTimes` have them
+    for name in STAMPS:
+        if stamps is None:
+            rec[name] = np.nan
+        else:
+            ts = [getattr(s, name) for s in stamps]
+            rec[name] = [np.nan if t is None else (t - stamps[0].send) / 1e9 for t in ts]
+    return rec
+
+# Merge the solves of the old pickles into the log ordered by the time of the solve, skipping those
+# which are already in it (so this can safely run any number of times); returns how many were added
+def migrate(solvedir=SOLVEDIR, path=LOGFILE):
+    log = np.array(load(path)) # copy, the file is replaced below
+    known = set(log['stamp'].tolist())
+    old = [
+        (sol, times, stamp) for sol, times, stamp in read_pickles(solvedir) if len(sol) > 0 and stamp not in known
+    ]
+    if not old:
+        return 0
+    solves = np.split(log, np.flatnonzero(log['index'] == 0)[1:]) if len(log) > 0 else []
+    solves += [records(sol, times, 0, stamp) for sol, times, stamp in old]
+    solves.sort(key=lambda rec: rec['stamp'][0]) # stable, solves of the same second keep their order
+    for i, rec in enumerate(solves):
+        rec['solve'] = i
+    with open(path + '.tmp', 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize))
+        f.write(np.concatenate(solves).tobytes())
+    os.replace(path + '.tmp', path)
+    return len(old)
+
+# Append several solves, given as (solution, move times, time of the solve); the first solves logged
+# also take over the history of the old pickles in `solvedir` (if any), so that it is never lost
+def append_many(solves, path=LOGFILE, solvedir=SOLVEDIR):
+    if solvedir is not None and os.path.isdir(solvedir) and len(load(path)) == 0:
+        migrate(solvedir, path)
+    if not os.path.exists(path) or os.path.getsize(path) < HEADER.size: # also if the header is incomplete
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize))
+    elif read_header(path)[1] != VERSION: # rewrite an older log as the current version first
+        recs = load(path)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.itemsize))
+            f.write(recs.tobytes())
+        os.replace(path + '.tmp', path)
+    log = load(path)
+    n = len(log)
+    solve = int(log['solve'][-1]) + 1 if n > 0 else 0
+    del log
+    recs = []
+    for sol, times, stamp in solves:
+        if len(sol) == 0: # solved cube
+            continue
+        recs.append(records(sol, times, solve, stamp))
+        solve += 1
+    if recs:
+        with open(path, 'r+b') as f:
+            # Drop a partially written last record (e.g. after a crash), everything appended behind it
+            # would be misaligned otherwise
+            f.seek(HEADER.size + n * RECORD.itemsize)
+            f.truncate()
+            f.write(np.concatenate(recs).tobytes())
+
+def append(sol, times, stamp, path=LOGFILE, solvedir=SOLVEDIR):
+    append_many([(sol, times, stamp)], path, solvedir)
+
+# Median of `values` for every key in `range(n)` (inf for keys without any values), vectorized
+def group_medians(keys, values, n):
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    lo = np.searchsorted(keys, np.arange(n), 'left')
+    cnt = np.searchsorted(keys, np.arange(n), 'right') - lo
+    med = np.full(n, float('inf'))
+    ok = cnt > 0
+    med[ok] = (values[lo[ok] + (cnt[ok] - 1) // 2] + values[lo[ok] + cnt[ok] // 2]) / 2
+    return med
+
+# Median, mean, variance and rate of lockups (more than `lockup` times the median) of `values` for
+# every key in `range(n)`
+def group_stats(keys, values, n, lockup):
+    med = group_medians(keys, values, n)
+    cnt = np.bincount(keys, minlength=n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(cnt > 0, np.bincount(keys, values, n) / cnt, float('inf'))
+        sq = np.bincount(keys, (values - mean[keys]) ** 2, n)
+        var = np.where(cnt > 1, sq / (cnt - 1), 0.)
+        lockups = np.bincount(keys, values > lockup * med[keys], n)
+        rate = np.where(cnt > 0, lockups / cnt, 0.)
+    return {'median': med, 'mean': mean, 'var': var, 'lockup': rate}
+
+# Cut class of the transition into every move (`NO_CLASS` for the first move of a solve)
+def prev_classes(log):
+    prev = np.full(len(log), NO_CLASS, dtype=np.int64)
+    prev[1:] = log['cls'][:-1]
+    prev[log['index'] == 0] = NO_CLASS
+    return prev
+
+# Keys of the pairwise model ([cls][is_half] for transitions, [is_axial][is_half] for last moves)
+def pair_keys(log):
+    last = log['cls'] < 0
+    keys = np.where(last, 2 * log['axial'], 2 * log['cls'].astype(np.int64)) + log['half']
+    return keys, last
+
+# Pairwise statistics (see `group_stats()`) as (transition table, last move table)
+def pair_stats(log, lockup):
+    keys, last = pair_keys(log)
+    cuts = group_stats(keys[~last], log['duration'][~last], 2 * N_CLASSES, lockup)
+    ends = group_stats(keys[last], log['duration'][last], 4, lockup)
+    return {
+        stat: (cuts[stat].reshape(N_CLASSES, 2), ends[stat].reshape(2, 2)) for stat in cuts
+    }
+
+# Medians and sample counts of the context model as ([prev][cls][is_half], [prev][is_axial][is_half])
+def context_medians(log):
+    keys, last = pair_keys(log)
+    prev = prev_classes(log)
+    res = []
+    for mask, shape in [(~last, (N_CLASSES + 1, N_CLASSES, 2)), (last, (N_CLASSES + 1, 2, 2))]:
+        n = shape[1] * shape[2]
+        keys1 = n * prev[mask] + keys[mask]
+        med = group_medians(keys1, log['duration'][mask], shape[0] * n)
+        cnt = np.bincount(keys1, minlength=shape[0] * n)
+        res.append((med.reshape(shape), cnt.reshape(shape)))
+    return res
+
+
+# Migration of the old `solves/*.pkl` files (named by the time of the solve) into the log; this happens
+# automatically with the first logged solve, but also merges them into a log which already has data.
+# Usage: python solvelog.py [solves/]
+if __name__ == '__main__':
+    import sys
+
+    src = sys.argv[1] if len(sys.argv) > 1 else SOLVEDIR
+    n = migrate(src)
+    log = load()
+    print('Migrated %d solves, the log now has %d solves (%d moves).' % (
+        n, len(np.unique(log['solve'])), len(log)
+    ))
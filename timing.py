@@ -0,0 +1,173 @@
+# Streaming version of `turn.py`: the move times of every class are tracked by P² quantile
+# estimators (Jain & Chlamtac, 1985) as well as running means, variances and lockup counts which
+# are all updated in O(1) per executed move, so that `turn.times` (and `turn.stats`) can be
+# refreshed after every solve without going through the whole history.
+
+import os
+import pickle
+from statistics import median
+
+from control import *
+import solvelog
+
+
+SKETCHFILE = 'turn.sketch'
+VERSION = 2 # of the pickled sketches; incompatible (e.g. older) ones are rebuilt from the history
+SOLVEDIR = solvelog.SOLVEDIR # old per-solve pickles, only used if they have not been migrated to the log yet
+LOCKUP_FACTOR = 2. # moves taking more than this times the median of their class count as lockups
+MIN_SAMPLES = 10 # classes with fewer moves keep their current times
+
+# Estimates the `p`-quantile of a stream from just 5 markers
+class P2:
+
+    def __init__(self, p=.5):
+        self.p = p
+        self.q = [] # marker heights (the first 5 observations until initialized)
+        self.n = [0, 1, 2, 3, 4] # actual marker positions
+        self.np = [0, 2 * p, 4 * p, 2 + 2 * p, 4] # desired marker positions
+        self.dn = [0, p / 2, p, (1 + p) / 2, 1]
+        self.count = 0
+
+    def add(self, x):
+        self.count += 1
+        q, n = self.q, self.n
+        if self.count <= 5:
+            q.append(x)
+            q.sort()
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+
+        # Move the middle markers towards their desired positions if necessary
+        for i in range(1, 4):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                tmp = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < tmp < q[i + 1]: # parabolic prediction is off, go linear
+                    tmp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = tmp
+                n[i] += d
+
+    def value(self):
+        if self.count == 0:
+            return float('inf')
+        if self.count <= 5: # exact
+            return median(self.q)
+        return self.q[2]
+
+# Running statistics of the times of a single class: median (P²), mean and variance (Welford) and
+# the rate of lockups
+class Stats:
+
+    def __init__(self):
+        self.median = P2()
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.lockups = 0
+
+    def add(self, x):
+        if self.median.count >= 5 and x > LOCKUP_FACTOR * self.median.value():
+            self.lockups += 1
+        self.median.add(x)
+        self.count += 1
+        d = x - self.mean
+        self.mean += d / self.count
+        self.m2 += d * (x - self.mean)
+
+    def value(self, stat):
+        if stat == 'median':
+            return self.median.value()
+        if stat == 'mean':
+            return self.mean
+        if stat == 'var':
+            return self.m2 / (self.count - 1) if self.count > 1 else 0.
+        return self.lockups / self.count # 'lockup'
+
+# Statistics for all cut classes (`[cls][is_half]`) and ending moves (`[is_axial][is_half]`)
+class TimingModel:
+
+    def __init__(self):
+        self.cut = [[Stats(), Stats()] for _ in range(N_CLASSES)]
+        self.end = [[Stats(), Stats()], [Stats(), Stats()]]
+
+    def update(self, sol, times):
+        if len(sol) == 0: # solved cube
+            return
+        for i in range(len(sol) - 1):
+            self.cut[cut(sol[i], sol[i + 1])][int(is_half(sol[i]))].add(times[i])
+        self.end[int(is_axial(sol[-1]))][int(is_half(sol[-1]))].add(times[-1])
+
+    # Add all moves of a `solvelog`
+    def update_log(self, log):
+        for cls, half, axial, t in zip(log['cls'], log['half'], log['axial'], log['duration']):
+            if cls >= 0:
+                self.cut[cls][int(half)].add(float(t))
+            else:
+                self.end[int(axial)][int(half)].add(float(t))
+
+    def save(self, path=SKETCHFILE):
+        dump((VERSION, self), path)
+
+    # Write the current medians to `turn.times` and the other statistics to `turn.stats`, which
+    # `control` then picks up via `reload_times()`; classes with fewer than `MIN_SAMPLES` moves keep
+    # their current values. The files are replaced atomically.
+    def save_times(self, path=TIMESFILE, stats_path=STATSFILE):
+        def values(stat, current):
+            return tuple(
+                [[s.value(stat) if s.count >= MIN_SAMPLES else t for s, t in zip(*row)]
+                    for row in zip(sketches, times)]
+                for sketches, times in zip([self.cut, self.end], current)
+            )
+        stats = {stat: values(stat, STATS[stat]) for stat in ['mean', 'var', 'lockup']}
+        dump(stats, stats_path)
+        dump(values('median', (CUTTIMES, ENDTIMES)), path)
+
+def dump(obj, path):
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump(obj, f)
+    os.replace(path + '.tmp', path)
+
+# Sketches of all solves so far, from the solve log or (if not migrated yet) the old `solves/*.pkl`
+def rebuild(logpath=solvelog.LOGFILE, solvedir=SOLVEDIR):
+    model = TimingModel()
+    model.update_log(solvelog.history(logpath, solvedir))
+    return model
+
+# The saved sketches, rebuilt from the history if there are none (or only incompatible ones)
+def load(path=SKETCHFILE, logpath=solvelog.LOGFILE, solvedir=SOLVEDIR):
+    if os.path.exists(path):
+        try:
+            version, model = pickle.load(open(path, 'rb'))
+            if version == VERSION:
+                return model
+        except (TypeError, ValueError, AttributeError, EOFError, pickle.UnpicklingError):
+            pass # sketch of an older version (a plain `TimingModel`)
+    return rebuild(logpath, solvedir)
+
+
+# Initialize the sketches from the full solve log (only needed once, afterwards they are updated
+# with every solve).
+# Usage: python timing.py
+if __name__ == '__main__':
+    model = rebuild()
+    model.save()
+    model.save_times()
+    print('Sketched %d moves.' % sum(s.count for rows in [model.cut, model.end] for row in rows for s in row))
@@ -0,0 +1,68 @@
+# Opt-in tracing of the robot's execution timeline (command building, USB writes, replies and how
+# long every brick is busy with a move) based on `time.perf_counter_ns()`. Traces are saved in
+# Chrome's trace event format and can be inspected in chrome://tracing or https://ui.perfetto.dev.
+
+import json
+import os
+import threading
+import time
+
+
+ENABLED = False
+EVENTS = []
+TRACKS = {} # id of a traced object -> name of its timeline
+PID = os.getpid()
+
+def now():
+    return time.perf_counter_ns()
+
+def enable():
+    global ENABLED
+    EVENTS.clear()
+    ENABLED = True
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+# Name of the timeline for `obj` (e.g. a brick connection), assigned in order of first appearance
+def track(obj):
+    key = id(obj)
+    if key not in TRACKS:
+        TRACKS[key] = 'ev3 %d' % len(TRACKS)
+    return TRACKS[key]
+
+# Event from `start` to `end` (in ns) on timeline `tid` (default the current thread)
+def complete(name, cat, start, end=None, tid=None, **args):
+    end = now() if end is None else end
+    EVENTS.append({
+        'name': name, 'cat': cat, 'ph': 'X', 'ts': start / 1000, 'dur': (end - start) / 1000,
+        'pid': PID, 'tid': threading.current_thread().name if tid is None else tid, 'args': args
+    })
+
+def instant(name, cat, tid=None, **args):
+    EVENTS.append({
+        'name': name, 'cat': cat, 'ph': 'i', 's': 't', 'ts': now() / 1000,
+        'pid': PID, 'tid': threading.current_thread().name if tid is None else tid, 'args': args
+    })
+
+# Context manager tracing the enclosed block (does nothing if tracing is disabled)
+class span:
+
+    def __init__(self, name, cat, **args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = now() if ENABLED else None
+        return self
+
+    def __exit__(self, exception_type, exception_value, traceback):
+        if self.start is not None:
+            complete(self.name, self.cat, self.start, **self.args)
+
+def save(path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True) # e.g. `traces/` on the first traced solve
+    with open(path, 'w') as f:
+        json.dump({'traceEvents': EVENTS, 'displayTimeUnit': 'ms'}, f)
@@ -1,40 +1,27 @@
 # Generates the table with average transition times for all corner cutting situations
 # based on data collected during previous solves.
 
-import os
 import pickle
-from statistics import median
-import numpy as np
+import sys
 from control import *
-
-DIR = 'solves/'
-
-data = []
-for f in os.listdir(DIR):
-    data.append(pickle.load(open(DIR + f, 'rb')))
-
-agg_cut = [[[], []] for _ in range(11)]
-# We also need ending move times for properly rating solutions
-agg_end = [[[], []], [[], []]] # [is_axial][is_half]
-
-for sol, times in data:
-    if len(sol) == 0: # solved cube
-        continue
-    for i in range(len(sol) - 1): # don't consider last move
-        agg_cut[cut(sol[i], sol[i + 1])][int(is_half(sol[i]))].append(times[i])
-    agg_end[int(is_axial(sol[-1]))][int(is_half(sol[-1]))].append(times[-1])
-
-# Use medians so that rare lockups in recorded data don't mess up the values
-med_cut = [[float('inf'), float('inf')] for _ in range(11)]
-for i in range(len(agg_cut)):
-    for j in range(len(agg_cut[i])):
-        if len(agg_cut[i][j]) > 0:
-            med_cut[i][j] = median(agg_cut[i][j])
-med_end = [[float('inf'), float('inf')], [float('inf'), float('inf')]]
-for i in range(2):
-    for j in range(2):
-        if len(agg_end[i][j]) > 0:
-            med_end[i][j] = median(agg_end[i][j])
-
-pickle.dump((med_cut, med_end), open('turn.times', 'wb'))
-
+import solvelog
+from timing import LOCKUP_FACTOR
+
+log = solvelog.history() # the old `solves/` pickles if they have not been migrated yet
+if len(log) == 0: # would only give infinite times
+    sys.exit('No solves in %s or %s, not touching turn.times.' % (solvelog.LOGFILE, solvelog.SOLVEDIR))
+
+# Use medians so that rare lockups in recorded data don't mess up the values; the spread (including
+# the lockups) is kept separately in `turn.stats` for tail-aware selection
+# We also need ending move times for properly rating solutions ([is_axial][is_half])
+stats = {
+    stat: (cuts.tolist(), ends.tolist())
+    for stat, (cuts, ends) in solvelog.pair_stats(log, LOCKUP_FACTOR).items()
+}
+pickle.dump(stats.pop('median'), open('turn.times', 'wb'))
+pickle.dump(stats, open('turn.stats', 'wb'))
+
+# Second-order model (including the previous move's transition); `control` only uses the contexts
+# with enough samples
+context = [(med.tolist(), cnt.tolist()) for med, cnt in solvelog.context_medians(log)]
+pickle.dump(context, open('turn.context', 'wb'))